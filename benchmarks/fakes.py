@@ -0,0 +1,80 @@
+"""Synthetic provider and notifier for benchmarks/loop.py.
+
+They are registered through the trackbert.providers and trackbert.notifiers
+entry points, like any third-party plugin. The provider reads its settings
+from the [FakeProvider] section of the config file:
+
+    latency: Seconds each request takes (default: 0.05)
+    failure_rate: Fraction of requests that fail (default: 0)
+    events: Number of events of every shipment (default: 5)
+    new_event_rate: Fraction of requests that return a new event (default: 0.5)
+"""
+
+from configparser import ConfigParser
+from datetime import datetime, timedelta
+
+import asyncio
+import random
+import time
+
+from trackbert.classes.database import Event
+from trackbert.classes.notifier import BaseNotifier
+from trackbert.classes.provider import BaseProvider
+from trackbert.classes.scheduler import utcnow
+
+
+class FakeProvider(BaseProvider):
+    def __init__(self, *args, **kwargs):
+        config = ConfigParser()
+        config.read(kwargs.get("config") or [])
+
+        self.latency = config.getfloat("FakeProvider", "latency", fallback=0.05)
+        self.failure_rate = config.getfloat("FakeProvider", "failure_rate", fallback=0)
+        self.events = config.getint("FakeProvider", "events", fallback=5)
+        self.new_event_rate = config.getfloat(
+            "FakeProvider", "new_event_rate", fallback=0.5
+        )
+
+    def get_status(self, tracking_number, carrier):
+        time.sleep(self.latency)
+        return self.make_events(tracking_number)
+
+    async def get_status_async(self, tracking_number, carrier):
+        await asyncio.sleep(self.latency)
+        return self.make_events(tracking_number)
+
+    def make_events(self, tracking_number):
+        if random.random() < self.failure_rate:
+            raise RuntimeError(f"Simulated failure for {tracking_number}")
+
+        base = datetime(2024, 1, 1)
+        times = [base + timedelta(hours=i) for i in range(self.events)]
+
+        if random.random() < self.new_event_rate:
+            times.append(utcnow().replace(microsecond=0))
+
+        return [
+            Event(
+                shipment_id=0,
+                event_time=event_time,
+                event_description=f"Status update for {tracking_number}",
+                raw_event={
+                    "tracking_number": tracking_number,
+                    "time": event_time.isoformat(),
+                    "status": "in_transit",
+                },
+            )
+            for event_time in times
+        ]
+
+    def supported_carriers(self):
+        return [("fake", 100, "Fake carrier")]
+
+
+class NullNotifier(BaseNotifier):
+    def notify(self, title: str, message: str, urgent: bool = False) -> None:
+        pass
+
+    @property
+    def enabled(self) -> bool:
+        return True
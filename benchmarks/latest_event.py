@@ -0,0 +1,100 @@
+"""Benchmark for Database.get_latest_event on a growing events table.
+
+Fills a temporary SQLite database with events in steps and measures the
+average time of a latest-event lookup after each step. With the
+(shipment_id, event_time) index in place, the lookup time should stay flat
+as the table grows.
+
+Usage:
+    python benchmarks/latest_event.py [--max-events 2000000] [--without-index]
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import random
+import time
+
+from sqlalchemy import insert, text
+from tabulate import tabulate
+
+from trackbert.classes.database import Database, Event, Shipment
+
+
+def fill(db, shipments, start, count):
+    base = datetime(2020, 1, 1)
+    batch = []
+
+    for i in range(start, start + count):
+        batch.append(
+            {
+                "shipment_id": i % shipments + 1,
+                "event_time": base + timedelta(minutes=i),
+                "event_description": f"Event {i}",
+            }
+        )
+
+        if len(batch) == 50000:
+            with db.engine.begin() as connection:
+                connection.execute(insert(Event), batch)
+            batch = []
+
+    if batch:
+        with db.engine.begin() as connection:
+            connection.execute(insert(Event), batch)
+
+
+def measure(db, shipments, lookups):
+    ids = [random.randint(1, shipments) for _ in range(lookups)]
+
+    start = time.perf_counter()
+    for shipment_id in ids:
+        db.get_latest_event(shipment_id)
+    return (time.perf_counter() - start) / lookups
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--shipments", type=int, default=1000)
+    parser.add_argument("--max-events", type=int, default=2000000)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--without-index", action="store_true")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tempdir:
+        db = Database(f"sqlite:///{Path(tempdir) / 'benchmark.db'}")
+
+        with db.engine.begin() as connection:
+            connection.execute(
+                insert(Shipment),
+                [
+                    {"tracking_number": f"BENCH{i}", "carrier": "bench"}
+                    for i in range(args.shipments)
+                ],
+            )
+
+            if args.without_index:
+                connection.execute(text("DROP INDEX ix_events_shipment_id_event_time"))
+
+        results = []
+        size = 0
+        step = 10000
+
+        while size < args.max_events:
+            target = min(step, args.max_events)
+            fill(db, args.shipments, size, target - size)
+            size = target
+            step *= 10 if step < 1000000 else 2
+
+            latency = measure(db, args.shipments, args.lookups)
+            results.append((size, f"{latency * 1e6:.1f}"))
+            print(f"{size} events: {latency * 1e6:.1f} µs per lookup", flush=True)
+
+        print()
+        print(tabulate(results, headers=["Events", "µs per lookup"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""End-to-end benchmark of the main loop with a synthetic provider.
+
+Registers the provider and notifier from benchmarks/fakes.py through the
+trackbert.providers and trackbert.notifiers entry points (using a temporary
+dist-info directory), seeds a temporary SQLite database with shipments and
+runs Core.start (start_loop) and Core.start_async (start_loop_async) for a
+number of cycles each, with every shipment due in every cycle.
+
+Reports the throughput, the per-shipment latency (time to query and process
+a shipment, including waiting for its turn), the number of database commits
+and the peak memory use. Each loop runs in a separate process, so that the
+peak memory use of one does not affect the other.
+
+Usage:
+    python benchmarks/loop.py [--shipments 1000] [--cycles 3] [--latency 0.05]
+        [--failure-rate 0.01] [--events 5] [--new-event-rate 0.5]
+        [--loops sync async]
+"""
+
+from argparse import SUPPRESS, ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import json
+import logging
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = """[trackbert.providers]
+fake = fakes:FakeProvider
+
+[trackbert.notifiers]
+null = fakes:NullNotifier
+"""
+
+CONFIG = """[Trackbert]
+database = sqlite:///{directory}/benchmark.db
+carrier_cache = {directory}/carriers.json
+min_interval = 0
+jitter = 0
+
+[FakeProvider]
+latency = {latency}
+failure_rate = {failure_rate}
+events = {events}
+new_event_rate = {new_event_rate}
+"""
+
+
+def register_plugins(directory: Path) -> None:
+    """Makes the fake provider and notifier available as entry points."""
+    dist_info = directory / "trackbert_benchmark_fakes-1.0.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text(
+        "Metadata-Version: 2.1\nName: trackbert-benchmark-fakes\nVersion: 1.0\n"
+    )
+    (dist_info / "entry_points.txt").write_text(ENTRY_POINTS)
+
+    sys.path[:0] = [str(directory), str(Path(__file__).parent)]
+
+
+def run_loop(loop: str, args) -> dict:
+    """Runs one of the loops for args.cycles cycles and returns the results."""
+    with TemporaryDirectory() as tempdir:
+        directory = Path(tempdir)
+        register_plugins(directory)
+
+        config = directory / "config.ini"
+        config.write_text(
+            CONFIG.format(
+                directory=directory,
+                latency=args.latency,
+                failure_rate=args.failure_rate,
+                events=args.events,
+                new_event_rate=args.new_event_rate,
+            )
+        )
+
+        from sqlalchemy import event
+
+        from trackbert.classes.core import Core
+        from trackbert.classes.database import Database
+
+        db = Database(f"sqlite:///{directory / 'benchmark.db'}")
+        db.upsert_shipments(
+            [
+                {"tracking_number": f"BENCH{i}", "carrier": "fake"}
+                for i in range(args.shipments)
+            ]
+        )
+        db.engine.dispose()
+
+        core = Core(config)
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+        commits = 0
+        failures = 0
+        latencies = []
+        cycles = 0
+
+        def count_commit(connection):
+            nonlocal commits
+            commits += 1
+
+        event.listen(core.db.engine, "commit", count_commit)
+
+        # Instrument the loop without changing what it does, except for not
+        # waiting between cycles and stopping after the last one
+
+        process_shipments = core.process_shipments
+        process_shipments_async = core.process_shipments_async
+        handle_query_error = core.handle_query_error
+        run_cycle = core.run_cycle
+        run_cycle_async = core.run_cycle_async
+
+        def timed_process_shipments(shipments):
+            start = time.perf_counter()
+            process_shipments(shipments)
+            latencies.extend([time.perf_counter() - start] * len(shipments))
+
+        async def timed_process_shipments_async(shipments):
+            start = time.perf_counter()
+            await process_shipments_async(shipments)
+            latencies.extend([time.perf_counter() - start] * len(shipments))
+
+        def counted_handle_query_error(shipments, error):
+            nonlocal failures
+            failures += len(shipments)
+            handle_query_error(shipments, error)
+
+        def limited_run_cycle():
+            nonlocal cycles
+            run_cycle()
+            cycles += 1
+            if cycles >= args.cycles:
+                raise KeyboardInterrupt
+
+        async def limited_run_cycle_async():
+            nonlocal cycles
+            await run_cycle_async()
+            cycles += 1
+            if cycles >= args.cycles:
+                raise KeyboardInterrupt
+
+        core.process_shipments = timed_process_shipments
+        core.process_shipments_async = timed_process_shipments_async
+        core.handle_query_error = counted_handle_query_error
+        core.run_cycle = limited_run_cycle
+        core.run_cycle_async = limited_run_cycle_async
+        core.seconds_until_due = lambda: 0
+
+        start = time.perf_counter()
+
+        try:
+            if loop == "sync":
+                core.start()
+            else:
+                import asyncio
+
+                asyncio.run(core.start_async())
+        except SystemExit:
+            pass
+
+        duration = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+
+    return {
+        "loop": loop,
+        "shipments": len(latencies),
+        "failures": failures,
+        "seconds": duration,
+        "throughput": len(latencies) / duration,
+        "p50": quantiles[49],
+        "p99": quantiles[98],
+        "commits": commits,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--shipments", type=int, default=1000)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    parser.add_argument("--events", type=int, default=5)
+    parser.add_argument("--new-event-rate", type=float, default=0.5)
+    parser.add_argument(
+        "--loops", nargs="+", choices=["sync", "async"], default=["sync", "async"]
+    )
+    parser.add_argument("--run", choices=["sync", "async"], help=SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_loop(args.run, args)))
+        return
+
+    from tabulate import tabulate
+
+    results = []
+
+    for loop in args.loops:
+        process = subprocess.run(
+            [sys.executable, __file__, *sys.argv[1:], "--run", loop],
+            capture_output=True,
+            text=True,
+        )
+
+        if process.returncode:
+            print(process.stderr, file=sys.stderr)
+            sys.exit(f"Benchmark of the {loop} loop failed")
+
+        result = json.loads(process.stdout.splitlines()[-1])
+        results.append(
+            (
+                "start_loop" if loop == "sync" else "start_loop_async",
+                result["shipments"],
+                result["failures"],
+                f"{result['seconds']:.2f}",
+                f"{result['throughput']:.1f}",
+                f"{result['p50'] * 1000:.1f}",
+                f"{result['p99'] * 1000:.1f}",
+                result["commits"],
+                f"{result['peak_rss']:.1f}",
+            )
+        )
+        print(f"{results[-1][0]}: {result['throughput']:.1f} shipments/s", flush=True)
+
+    print()
+    print(
+        tabulate(
+            results,
+            headers=[
+                "Loop",
+                "Shipments",
+                "Failed",
+                "Seconds",
+                "Shipments/s",
+                "p50 (ms)",
+                "p99 (ms)",
+                "Commits",
+                "Peak RSS (MB)",
+            ],
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Microbenchmark of the response parsing of every built-in provider.
+
+Replays the recorded responses from benchmarks/fixtures through each
+provider's get_status() (see benchmarks/replay.py), without any network
+access, and measures the cost per event: decoding the response, detecting
+changes, sorting, and converting every event into an Event. Each response is
+measured as recorded and with a long history of --scans events.
+
+Every request uses a new tracking number, so that the response cache never
+skips parsing. Providers whose API client library cannot be imported are
+skipped.
+
+Results can be saved with --save and compared to a saved run with
+--compare. The script exits with status 1 if a provider does not return all
+events of a response, or if it got more than --tolerance slower than in the
+saved run.
+
+Usage:
+    python benchmarks/parsers.py [--scans 200] [--time 0.5]
+        [--save results.json] [--compare results.json] [--tolerance 0.25]
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+import json
+import logging
+import sys
+import time
+
+from tabulate import tabulate
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from replay import CARRIERS, count_events, install_replay, load_fixture, replay_provider
+
+
+def measure(provider, carrier: str, expected: int, duration: float, repeat: int = 3):
+    """Returns the seconds per response, or raises if events are missing.
+
+    The response is parsed once before measuring, so that lazy imports are
+    not measured. Returns the best of `repeat` runs of `duration` seconds.
+    """
+    iterations = 0
+    best = None
+
+    for run in range(repeat + 1):
+        count = 0
+        start = time.perf_counter()
+
+        while True:
+            events = list(provider.get_status(f"REPLAY{iterations}", carrier))
+            iterations += 1
+            count += 1
+
+            if len(events) != expected:
+                raise ValueError(f"Got {len(events)} of {expected} events")
+
+            elapsed = time.perf_counter() - start
+            if not run or (elapsed >= duration / repeat and count >= 5):
+                break
+
+        if run and (best is None or elapsed / count < best):
+            best = elapsed / count
+
+    return best
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--scans", type=int, default=200)
+    parser.add_argument("--time", type=float, default=0.5, help="seconds per case")
+    parser.add_argument("--save", type=str, help="file to save the results to")
+    parser.add_argument("--compare", type=str, help="file with results to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    # Errors are reported in the results instead
+    logging.disable(logging.CRITICAL)
+
+    handler = install_replay()
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else {}
+    measurements = {}
+    results = []
+    failed = []
+
+    for name, carrier in CARRIERS.items():
+        for scans in (None, args.scans):
+            payload = load_fixture(name, scans)
+            expected = count_events(name, payload)
+            case = f"{name}/{expected}"
+
+            try:
+                provider = replay_provider(name, payload, handler)
+            except Exception as e:
+                results.append((name, expected, "-", "-", "-", f"skipped: {e}"))
+                break
+
+            try:
+                per_response = measure(provider, carrier, expected, args.time)
+            except Exception as e:
+                results.append((name, expected, "-", "-", "-", f"failed: {e}"))
+                failed.append(case)
+                continue
+
+            per_event = per_response / expected * 1e6
+            measurements[case] = per_event
+
+            if case in baseline:
+                change = per_event / baseline[case] - 1
+                note = f"{change:+.0%} vs. baseline"
+
+                if change > args.tolerance:
+                    failed.append(case)
+            else:
+                note = ""
+
+            results.append(
+                (
+                    name,
+                    expected,
+                    f"{per_event:.1f}",
+                    f"{per_response * 1000:.2f}",
+                    f"{1 / per_response:.0f}",
+                    note,
+                )
+            )
+
+    print(
+        tabulate(
+            results,
+            headers=[
+                "Provider",
+                "Events",
+                "µs per event",
+                "ms per response",
+                "Responses/s",
+                "",
+            ],
+        )
+    )
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(measurements, indent=2))
+
+    if failed:
+        print(f"\nFailed or slower than the baseline: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Local stand-ins for the carrier APIs, replaying recorded responses.
+
+The recorded responses in benchmarks/fixtures are anonymized responses of
+the APIs used by the built-in providers. replay_provider() creates a provider
+whose API client is replaced by a ReplayAPI, so that the provider's own code
+(building requests, detecting changes, parsing) runs unchanged, but without
+any network access:
+
+- Providers that build requests with the API client and send them through
+  urllib (KeyDelivery, DHL, GLS, FedEx) get requests to replay:// URLs,
+  which are answered by the ReplayHandler installed by install_replay().
+- Providers that let the API client send the request (DPD, PostAT) get the
+  decoded response right away.
+
+Usage:
+    handler = install_replay()
+    provider = replay_provider("dhl", load_fixture("dhl", scans=200), handler)
+    events = list(provider.get_status("00340434000000000001", "dhl"))
+"""
+
+from email.message import Message
+from io import BytesIO
+from pathlib import Path
+from typing import Optional
+from urllib.request import BaseHandler, Request, build_opener, install_opener, urlopen
+from urllib.response import addinfourl
+
+import importlib
+import json
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+# Where each response keeps its list of events
+EVENTS = {
+    "keydelivery": ("data", "items"),
+    "dhl": ("shipments", 0, "events"),
+    "fedex": ("output", "completeTrackResults", 0, "trackResults", 0, "scanEvents"),
+    "gls": ("tuStatus", 0, "history"),
+    "postat": ("data", "einzelsendung", "sendungsEvents"),
+    "dpd": ("data", 0, "lifecycle", "entries"),
+}
+
+CARRIERS = {
+    "keydelivery": "dhl",
+    "dhl": "dhl",
+    "fedex": "fedex",
+    "gls": "gls",
+    "postat": "austrian_post",
+    "dpd": "dpd",
+}
+
+TOKEN = json.dumps({"access_token": "replay", "expires_in": 3600}).encode()
+
+
+def load_fixture(name: str, scans: Optional[int] = None):
+    """Loads a recorded response.
+
+    Args:
+        name (str): Name of the provider module, e.g. "dhl".
+        scans (int, optional): Number of events the response should have.
+            The recorded events are repeated (or cut off) to get there.
+    """
+    payload = json.loads((FIXTURES / f"{name}.json").read_text())
+
+    if scans is not None:
+        *path, key = EVENTS[name]
+
+        container = payload
+        for step in path:
+            container = container[step]
+
+        events = container[key]
+        container[key] = [events[i % len(events)] for i in range(scans)]
+
+    return payload
+
+
+def count_events(name: str, payload) -> int:
+    events = payload
+    for step in EVENTS[name]:
+        events = events[step]
+
+    return len(events)
+
+
+class ReplayHandler(BaseHandler):
+    """Answers requests to replay://<provider>/... with the recorded response."""
+
+    def __init__(self):
+        self.bodies = {}
+
+    def replay_open(self, request):
+        if request.selector.split("?")[0].endswith("oauth/token"):
+            body = TOKEN
+        else:
+            body = self.bodies[request.host]
+
+        return addinfourl(BytesIO(body), Message(), request.full_url, 200)
+
+
+class ReplayRequest(Request):
+    def execute(self, load_json: bool = True):
+        body = urlopen(self).read()
+        return json.loads(body) if load_json else body
+
+
+class ReplayAPI:
+    """Stand-in for the API clients used by the built-in providers."""
+
+    OAUTH_TOKEN = "oauth/token"
+    TRACK_BY_NUMBER = "track/v1/trackingnumbers"
+
+    key = secret = "replay"
+
+    def __init__(self, name: str, payload):
+        self.name = name
+        self.payload = payload
+
+    def get_request(self, endpoint: str, *args, **kwargs) -> ReplayRequest:
+        return ReplayRequest(f"replay://{self.name}/{endpoint}")
+
+    # DPD
+    def tracking(self, tracking_number):
+        return self.payload
+
+    # PostAT
+    def get_shipment_status(self, tracking_number):
+        return self.payload
+
+
+def install_replay() -> ReplayHandler:
+    """Makes urllib answer replay:// requests. Returns the handler."""
+    handler = ReplayHandler()
+    install_opener(build_opener(handler))
+    return handler
+
+
+def replay_provider(name: str, payload, handler: ReplayHandler):
+    """Creates a provider that gets `payload` for every tracking number.
+
+    The provider's __init__ is skipped, so neither a config file nor API
+    credentials are needed, but the provider module (and thus its API client
+    library) must be importable.
+
+    Raises:
+        ImportError: If the provider module cannot be imported.
+    """
+    provider_class = importlib.import_module(f"trackbert.providers.{name}").provider
+
+    provider = provider_class.__new__(provider_class)
+    provider.api = ReplayAPI(name, payload)
+
+    if name == "fedex":
+        provider._token = None
+        provider._token_expiry = 0
+
+    handler.bodies[name] = json.dumps(payload).encode()
+
+    return provider
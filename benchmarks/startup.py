@@ -0,0 +1,127 @@
+"""Startup time budget for the trackbert command line interface.
+
+Checks that importing the CLI entry point stays cheap, and that a short
+command (disabling a shipment that does not exist) stays within the time
+budget once the carrier cache has been filled. Also checks that this command
+neither imports Alembic and tabulate, nor any provider whose carriers are
+cached.
+
+Exits with status 1 if a budget is exceeded, so it can be used in CI.
+
+Usage:
+    python benchmarks/startup.py [--import-budget 50] [--budget 1000] [--runs 5]
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from tabulate import tabulate
+
+CONFIG = """[Trackbert]
+database = sqlite:///{directory}/benchmark.db
+carrier_cache = {directory}/carriers.json
+
+[KeyDelivery]
+key = benchmark
+secret = benchmark
+
+[FedEx]
+key = benchmark
+secret = benchmark
+
+[DHL]
+key = benchmark
+secret = benchmark
+"""
+
+
+def parse_importtime(stderr):
+    """Returns the cumulative import time in µs of each imported module."""
+    modules = {}
+
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, module = line.split("|")
+        modules[module.strip()] = int(cumulative)
+
+    return modules
+
+
+def run(*args, cwd=None):
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+    )
+    return time.perf_counter() - start, parse_importtime(process.stderr)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--import-budget", type=float, default=50, help="ms")
+    parser.add_argument("--budget", type=float, default=1000, help="ms")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    _, modules = run("-c", "import trackbert.__main__")
+    import_time = modules["trackbert.__main__"] / 1000
+
+    with TemporaryDirectory() as tempdir:
+        config = Path(tempdir) / "config.ini"
+        config.write_text(CONFIG.format(directory=tempdir))
+
+        command = ["-m", "trackbert", "-C", str(config), "-n", "BENCHMARK", "-D"]
+
+        # Creates the database and fills the carrier cache
+        run(*command, cwd=tempdir)
+
+        durations = []
+        for _ in range(args.runs):
+            duration, modules = run(*command, cwd=tempdir)
+            durations.append(duration * 1000)
+
+        cached = json.loads((Path(tempdir) / "carriers.json").read_text())
+
+    command_time = statistics.median(durations)
+
+    unexpected = sorted(
+        module
+        for module in modules
+        if module in cached or module in ("alembic", "tabulate")
+    )
+
+    results = [
+        ("Import trackbert.__main__", f"{import_time:.1f}", args.import_budget),
+        ("Short command (median)", f"{command_time:.1f}", args.budget),
+    ]
+
+    print(tabulate(results, headers=["Measurement", "ms", "Budget (ms)"]))
+    print()
+    print(f"Providers loaded lazily: {', '.join(sorted(cached)) or 'none'}")
+
+    failed = False
+
+    if import_time > args.import_budget or command_time > args.budget:
+        print("Startup time budget exceeded")
+        failed = True
+
+    if unexpected:
+        print(f"Imported although not needed: {', '.join(unexpected)}")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,8 @@
 from pathlib import Path
-from tabulate import tabulate
+from contextlib import nullcontext
 
 import argparse
-import asyncio
-
-
-from .classes.core import Core
+import sys
 
 
 def main():
@@ -56,6 +53,21 @@ def main():
         required=False,
         help="List supported carriers",
     )
+    parser.add_argument(
+        "--refresh-carriers",
+        action="store_true",
+        required=False,
+        help="Refresh the cached lists of supported carriers",
+    )
+
+    # Arguments related to the database
+
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        required=False,
+        help="Upgrade the database schema to the latest version",
+    )
 
     # Arguments related to the config file
 
@@ -73,6 +85,63 @@ def main():
         help="Path to the config file to use or generate (default: config.ini)",
     )
 
+    # Commands for bulk operations
+
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+
+    import_parser = subparsers.add_parser(
+        "import", help="Create or update shipments from a CSV or NDJSON file"
+    )
+    import_parser.add_argument(
+        "file", type=str, help="File to import, or - to read from standard input"
+    )
+    import_parser.add_argument(
+        "--format",
+        choices=["csv", "ndjson"],
+        help="Format of the file (default: guessed from the file name, or csv)",
+    )
+    import_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=5000,
+        help="Number of shipments to write per transaction (default: 5000)",
+    )
+
+    export_parser = subparsers.add_parser(
+        "export", help="Export shipments to a CSV or NDJSON file"
+    )
+    export_parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        default="-",
+        help="File to export to (default: standard output)",
+    )
+    export_parser.add_argument(
+        "--format",
+        choices=["csv", "ndjson"],
+        help="Format of the file (default: guessed from the file name, or csv)",
+    )
+    export_parser.add_argument(
+        "--events",
+        action="store_true",
+        help="Include the events of each shipment",
+    )
+
+    archive_parser = subparsers.add_parser(
+        "archive", help="Move old shipments and their events to the archive"
+    )
+    archive_parser.add_argument(
+        "--after",
+        type=float,
+        help="Archive disabled shipments without events for this many days (default: archive_after)",
+    )
+    archive_parser.add_argument(
+        "--idle-after",
+        type=float,
+        help="Also archive active shipments without new events for this many days (default: archive_idle_after)",
+    )
+
     args = parser.parse_args()
 
     # Generate config file if requested
@@ -96,29 +165,155 @@ def main():
         print(f"Config file {config_file} does not exist. Use -g to generate it.")
         exit(1)
 
+    # Commands that only work on the database do without the tracker, which
+    # would load every provider and start its background threads
+
+    if args.migrate or args.command in ("import", "export", "archive"):
+        from configparser import ConfigParser
+
+        from .classes.database import Database
+
+        config = ConfigParser()
+        config.read(config_file)
+
+        database_uri = config.get(
+            "Trackbert", "database", fallback="sqlite:///trackbert.db"
+        )
+
+    # Upgrade the database if requested, without starting the tracker, which
+    # would upgrade it on its own
+
+    if args.migrate:
+        db = Database(database_uri, migrate=False)
+
+        if db.is_up_to_date():
+            print("Database is already up to date")
+        else:
+            db.run_migrations()
+
+        print(f"Database is at revision {', '.join(sorted(db.get_current_revisions()))}")
+        exit(0)
+
+    # Import shipments if requested
+
+    if args.command == "import":
+        from itertools import islice
+
+        from .classes.transfer import guess_format, read_shipments
+
+        db = Database(database_uri)
+        format = args.format or guess_format(args.file)
+        created = updated = 0
+
+        with (
+            nullcontext(sys.stdin)
+            if args.file == "-"
+            else open(args.file, newline="", encoding="utf-8")
+        ) as stream:
+            shipments = read_shipments(stream, format)
+
+            try:
+                while batch := list(islice(shipments, args.batch_size)):
+                    batch_created, batch_updated = db.upsert_shipments(batch)
+                    created += batch_created
+                    updated += batch_updated
+
+            except ValueError as e:
+                print(f"Invalid input, stopping after {created + updated} shipments: {e}")
+                exit(1)
+
+        print(f"Imported {created + updated} shipments ({created} created, {updated} updated)")
+        exit(0)
+
+    # Export shipments if requested
+
+    if args.command == "export":
+        from .classes.transfer import export_rows, guess_format, write_shipments
+
+        db = Database(database_uri)
+        format = args.format or guess_format(args.output)
+
+        with (
+            nullcontext(sys.stdout)
+            if args.output == "-"
+            else open(args.output, "w", newline="", encoding="utf-8")
+        ) as stream:
+            count = write_shipments(
+                stream,
+                export_rows(db.export_shipments(args.events), args.events, format),
+                format,
+                args.events,
+            )
+
+        print(f"Exported {count} records", file=sys.stderr)
+        exit(0)
+
+    # Archive old shipments if requested
+
+    if args.command == "archive":
+        from datetime import timedelta
+
+        from .classes.scheduler import utcnow
+
+        after = (
+            config.getfloat("Trackbert", "archive_after", fallback=0)
+            if args.after is None
+            else args.after
+        )
+        idle_after = (
+            config.getfloat("Trackbert", "archive_idle_after", fallback=0)
+            if args.idle_after is None
+            else args.idle_after
+        )
+
+        if args.after is None and not after:
+            print("Set archive_after in the config file or use --after.")
+            exit(1)
+
+        db = Database(database_uri)
+        now = utcnow()
+        count = db.archive_shipments(
+            now - timedelta(days=after),
+            now - timedelta(days=idle_after) if idle_after else None,
+            now,
+        )
+
+        if count:
+            db.vacuum()
+
+        print(f"Archived {count} shipments")
+        exit(0)
+
+    # Only import the heavy parts once they are actually needed
+
+    from .classes.core import Core
+
     tracker = Core(config_file)
 
+    # Refresh carrier lists if requested
+
+    if args.refresh_carriers:
+        if not tracker.refresh_carriers():
+            print("Could not refresh all carrier lists, see log for details.")
+            exit(1)
+
+        print("Refreshed carrier lists")
+        exit(0)
+
     # List carriers if requested
 
     if args.list_carriers:
+        # Wait for the carriers that are not cached yet
+        if tracker.carrier_refresh:
+            tracker.carrier_refresh.join()
+
+        from tabulate import tabulate
+
         print("Supported carriers:\n")
 
-        carriers = set(
-            [
-                (provider[0], (provider[3] if len(provider) > 3 else None))
-                for provider in tracker.providers
-                if not any(
-                    [
-                        others[1] > provider[1]
-                        for others in filter(
-                            lambda x: x[0] == provider[0], tracker.providers
-                        )
-                    ]
-                )
-            ]
-        )
+        carriers = tracker.registry.list_carriers()
 
-        print(tabulate(sorted(carriers, key=lambda x: x[0]), headers=["Code", "Name"]))
+        print(tabulate(carriers, headers=["Code", "Name"]))
         exit(0)
 
     if args.tracking_number is not None and args.carrier is not None:
@@ -151,6 +346,12 @@ def main():
                 f"Created shipment for {args.tracking_number} with carrier {args.carrier}"
             )
 
+            shipment = tracker.db.get_shipment(args.tracking_number)
+            tracker.sync_shipment(shipment)
+
+            if event := tracker.db.get_latest_event(shipment.id):
+                print(f"Latest event: {event.event_description} - {event.local_time()}")
+
             exit(0)
 
         print("How did you get here?")
@@ -168,6 +369,8 @@ def main():
         print("You must specify a carrier with -c")
         exit(1)
 
+    import asyncio
+
     asyncio.run(tracker.start_async())
 
 
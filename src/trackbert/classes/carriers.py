@@ -0,0 +1,98 @@
+from typing import List, Optional
+from pathlib import Path
+from os import PathLike
+
+import json
+import logging
+import os
+import threading
+import time
+
+
+class CarrierCache:
+    """On-disk cache of the carriers supported by each provider.
+
+    Stores the carriers of every provider in a JSON file, keyed by where the
+    provider comes from (module or entry point), so that neither the provider
+    modules need to be imported nor the carrier lists fetched over the
+    network every time Trackbert starts.
+
+    Each entry has a fingerprint of the provider's code (e.g. file size and
+    modification time, or package version) and is ignored once that changes.
+    Entries of providers that fetch their carriers from an API (`dynamic`)
+    are considered stale after `ttl` seconds, but are still used until they
+    have been refreshed successfully.
+    """
+
+    def __init__(self, path: PathLike, ttl: float = 7 * 86400):
+        self.path = Path(path)
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        self.data = None
+
+    def load(self) -> dict:
+        try:
+            return json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read carrier cache {self.path}: {e}")
+            return {}
+
+    def get(self, key: str, fingerprint: Optional[str] = None) -> Optional[dict]:
+        """Returns the cached carriers of a provider.
+
+        Args:
+            key (str): Identifies the provider, e.g. its module name.
+            fingerprint (str, optional): Fingerprint of the provider's code.
+
+        Returns:
+            dict: The entry, with "name", "carriers" (as tuples), "dynamic"
+                and "fresh", or None if nothing usable is cached.
+        """
+        with self.lock:
+            if self.data is None:
+                self.data = self.load()
+
+            entry = self.data.get(key)
+
+        if not entry or entry.get("fingerprint") != fingerprint:
+            return None
+
+        return {
+            "name": entry["name"],
+            "carriers": [tuple(carrier) for carrier in entry["carriers"]],
+            "dynamic": entry["dynamic"],
+            "fresh": not entry["dynamic"]
+            or time.time() - entry["fetched_at"] < self.ttl,
+        }
+
+    def put(
+        self,
+        key: str,
+        name: str,
+        carriers: List[tuple],
+        fingerprint: Optional[str] = None,
+        dynamic: bool = False,
+    ) -> None:
+        with self.lock:
+            # Re-read the file, another process may have updated it
+            self.data = self.load()
+            self.data[key] = {
+                "name": name,
+                "fingerprint": fingerprint,
+                "dynamic": dynamic,
+                "fetched_at": time.time(),
+                "carriers": [list(carrier) for carrier in carriers],
+            }
+
+            # Write to a temporary file first, so that concurrent readers
+            # never see a partially written cache
+            temp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+
+            try:
+                temp_path.write_text(json.dumps(self.data))
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logging.warning(f"Could not write carrier cache {self.path}: {e}")
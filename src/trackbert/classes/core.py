@@ -3,20 +3,42 @@ import time
 import importlib
 import asyncio
 import importlib.metadata
+import os
+import socket
+import threading
 
 import sqlalchemy.exc
 
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Never
 from os import PathLike
 from configparser import ConfigParser
 
+from .carriers import CarrierCache
 from .database import Database
+from .dispatcher import NotificationDispatcher
+from .http import install_keepalive
+from .metrics import (
+    METRICS,
+    CYCLE_DURATION,
+    CYCLE_SHIPMENTS,
+    PROVIDER_REQUESTS,
+    SHIPMENT_CHECKS,
+    SHIPMENT_TIMEOUTS,
+    start_metrics_server,
+)
+from .provider import BaseProvider, LazyProvider
+from .ratelimit import RateLimiter, RateLimitExceeded
+from .registry import ProviderRegistry
+from .scheduler import Scheduler, utcnow
+from .writer import EventWriter
 
 
 class Core:
     loop_interval: int = 60
     loop_timeout: int = 30
+    ratelimit_wait: int = 10
 
     config: Optional[ConfigParser] = None
 
@@ -28,8 +50,37 @@ class Core:
         )
 
         self._pre_start(config)
+        install_keepalive()
+
         self.notifiers = self.find_notifiers()
+        self.dispatcher = NotificationDispatcher(
+            self.db,
+            self.notifiers,
+            self.config.getint("Trackbert", "notify_batch_size", fallback=50),
+            self.config.getfloat("Trackbert", "notify_retry_delay", fallback=30),
+            self.config.getfloat("Trackbert", "notify_max_retry_delay", fallback=3600),
+            worker_id=self.worker_id,
+            lease_time=self.lease_time,
+        )
+
+        self.carrier_providers = []
+        self.stale_carriers = []
         self.providers = self.find_providers()
+        self.registry = ProviderRegistry(self.providers)
+
+        # Don't hold up startup while refreshing the carrier lists
+        self.carrier_refresh = None
+        if self.stale_carriers:
+            self.carrier_refresh = threading.Thread(
+                target=self.refresh_carriers,
+                args=(self.stale_carriers,),
+                name="carrier-refresh",
+                daemon=True,
+            )
+            self.carrier_refresh.start()
+
+        self.rate_limiters = {}
+        self.initial_syncs = set()
 
     def find_core_notifiers(self):
         logging.debug("Finding core notifiers")
@@ -74,10 +125,7 @@ class Core:
         logging.debug("Finding external notifiers")
         notifiers = []
 
-        for entry_point in importlib.metadata.entry_points():
-            if entry_point.group != "trackbert.notifiers":
-                continue
-
+        for entry_point in importlib.metadata.entry_points(group="trackbert.notifiers"):
             logging.debug(f"Considering external notifier {entry_point.name}")
 
             try:
@@ -116,32 +164,16 @@ class Core:
 
             logging.debug(f"Considering provider {provider.stem}")
 
-            try:
-                module = importlib.import_module(f"trackbert.providers.{provider.stem}")
-            except Exception as e:
-                logging.error(f"Error loading class {provider.stem}: {e}")
-                continue
+            module_name = f"trackbert.providers.{provider.stem}"
+            stat = provider.stat()
 
-            if "provider" in module.__dict__:
-                provider_api = module.provider
-                logging.debug(f"Found provider {provider_api.__name__}")
-                try:
-                    pobj = provider_api(config=self.config_path)
-                    carriers = pobj.supported_carriers()
-
-                    for carrier in carriers:
-                        providers.append(
-                            (
-                                carrier[0],
-                                carrier[1],
-                                pobj,
-                                (carrier[2] if len(carrier) > 2 else None),
-                            )
-                        )
-                except Exception as e:
-                    logging.error(
-                        f"Error loading provider {provider.__class__.__name__}: {e}"
-                    )
+            providers += self.load_provider(
+                module_name,
+                lambda module_name=module_name: importlib.import_module(
+                    module_name
+                ).provider,
+                f"{stat.st_mtime_ns}-{stat.st_size}",
+            )
 
         return providers
 
@@ -150,100 +182,458 @@ class Core:
 
         providers = []
 
-        for entry_point in importlib.metadata.entry_points():
-            if entry_point.group != "trackbert.providers":
-                continue
-
+        for entry_point in importlib.metadata.entry_points(group="trackbert.providers"):
             logging.debug(f"Considering external provider {entry_point.name}")
 
-            try:
-                provider = entry_point.load()
-            except Exception as e:
-                logging.error(f"Error loading class {entry_point.name}: {e}")
-                continue
+            dist = getattr(entry_point, "dist", None)
 
-            try:
-                pobj = provider(config=self.config_path)
+            providers += self.load_provider(
+                f"{entry_point.group}:{entry_point.name}",
+                entry_point.load,
+                f"{dist.name}-{dist.version}" if dist else None,
+            )
+
+        return providers
+
+    def load_provider(self, key: str, loader, fingerprint: Optional[str] = None) -> list:
+        """Loads a provider and returns its entries for the provider registry.
+
+        If the provider's carriers are in the carrier cache, the provider is
+        not loaded right away, but only once it is used. Carriers fetched from
+        an API are refreshed in the background if they are stale. Otherwise,
+        the provider is loaded and its carriers are cached.
+
+        Args:
+            key (str): Identifies the provider in the carrier cache.
+            loader (Callable): Returns the provider class.
+            fingerprint (str, optional): Changes whenever the provider's code
+                changes.
+
+        Returns:
+            list: (carrier, priority, provider, name) tuples.
+        """
+        if cached := self.carrier_cache.get(key, fingerprint):
+            pobj = LazyProvider(loader, cached["name"], config=self.config_path)
+            carriers = cached["carriers"]
+
+            if cached["dynamic"]:
+                self.carrier_providers.append((key, fingerprint, pobj))
+
+                if not cached["fresh"]:
+                    self.stale_carriers.append((key, fingerprint, pobj))
+
+            return self.provider_entries(pobj, carriers)
+
+        try:
+            provider = loader()
+        except Exception as e:
+            logging.error(f"Error loading class {key}: {e}")
+            return []
+
+        logging.debug(f"Found provider {provider.__name__}")
+
+        try:
+            pobj = provider(config=self.config_path)
+
+            # Carriers fetched over the network are only cached once fetched
+            # successfully, in the background
+            if type(pobj).fetch_carriers is not BaseProvider.fetch_carriers:
+                self.carrier_providers.append((key, fingerprint, pobj))
+                self.stale_carriers.append((key, fingerprint, pobj))
+                carriers = pobj.fallback_carriers
+            else:
                 carriers = pobj.supported_carriers()
+                self.carrier_cache.put(key, pobj.name, carriers, fingerprint)
 
-                for carrier in carriers:
-                    providers.append(
-                        (
-                            carrier[0],
-                            carrier[1],
-                            pobj,
-                            (carrier[2] if len(carrier) > 2 else None),
-                        )
-                    )
+        except Exception as e:
+            logging.error(f"Error loading provider {provider.__name__}: {e}")
+            return []
+
+        return self.provider_entries(pobj, carriers)
+
+    @staticmethod
+    def provider_entries(pobj, carriers) -> list:
+        return [
+            (
+                carrier[0],
+                carrier[1],
+                pobj,
+                (carrier[2] if len(carrier) > 2 else None),
+            )
+            for carrier in carriers
+        ]
+
+    def refresh_carriers(self, providers: Optional[list] = None) -> bool:
+        """Fetches the carriers of providers from their APIs.
+
+        Successfully fetched carriers are written to the carrier cache and
+        replace the provider's current carriers. If fetching fails, the
+        previous carriers are kept.
+
+        Args:
+            providers (list, optional): The (key, fingerprint, provider)
+                tuples to refresh. Defaults to all providers that fetch
+                their carriers over the network.
+
+        Returns:
+            bool: Whether all providers were refreshed successfully.
+        """
+        success = True
+
+        for key, fingerprint, pobj in (
+            self.carrier_providers if providers is None else providers
+        ):
+            try:
+                carriers = pobj.fetch_carriers()
             except Exception as e:
-                logging.error(
-                    f"Error loading provider {provider.__class__.__name__}: {e}"
+                logging.warning(
+                    f"Could not refresh carriers of {pobj.name}, keeping previous list: {e}"
                 )
+                success = False
+                continue
 
-        return providers
+            self.carrier_cache.put(key, pobj.name, carriers, fingerprint, dynamic=True)
+            self.set_carriers(pobj, carriers)
+
+            logging.debug(f"Refreshed {len(carriers)} carriers of {pobj.name}")
+
+        return success
+
+    def set_carriers(self, pobj, carriers) -> None:
+        entries = self.provider_entries(pobj, carriers)
+
+        # Keep the provider's place in the list, which decides ties
+        index = next(
+            (i for i, entry in enumerate(self.providers) if entry[2] is pobj),
+            len(self.providers),
+        )
+        others = [entry for entry in self.providers if entry[2] is not pobj]
+
+        self.providers = others[:index] + entries + others[index:]
+        self.registry = ProviderRegistry(self.providers)
 
     def find_providers(self):
         return self.find_core_providers() + self.find_external_providers()
 
+    def remove_provider(self, pobj) -> None:
+        """Removes a provider from the registry, e.g. if it fails to load.
+
+        Its carriers fall through to the next provider supporting them.
+        """
+        self.providers = [entry for entry in self.providers if entry[2] is not pobj]
+        self.registry = ProviderRegistry(self.providers)
+
+        self.carrier_providers = [
+            entry for entry in self.carrier_providers if entry[2] is not pobj
+        ]
+        self.stale_carriers = [
+            entry for entry in self.stale_carriers if entry[2] is not pobj
+        ]
+
+    def get_provider(self, tracking_number: str, carrier: str):
+        while provider := self.registry.get(carrier):
+            # Providers from the carrier cache are only loaded now, so a
+            # provider that no longer loads is dropped instead of failing
+            # every cycle
+            if isinstance(provider, LazyProvider):
+                try:
+                    provider.load()
+                except Exception as e:
+                    logging.error(f"Error loading provider {provider.name}: {e}")
+                    self.remove_provider(provider)
+                    continue
+
+            logging.debug(
+                f"Using provider {provider.name} for {tracking_number} with carrier {carrier}"
+            )
+            return provider
+
+    def get_rate_limiter(self, provider) -> Optional[RateLimiter]:
+        name = provider.name
+
+        if name not in self.rate_limiters:
+            self.rate_limiters[name] = RateLimiter.from_config(
+                self.config,
+                name,
+                provider.requests_per_second,
+                provider.burst,
+                provider.daily_limit,
+            )
+
+        return self.rate_limiters[name]
+
+    def reserve_request(self, provider) -> float:
+        if not (limiter := self.get_rate_limiter(provider)):
+            return 0
+
+        if (wait := limiter.reserve(self.ratelimit_wait)) is None:
+            raise RateLimitExceeded(provider.name, limiter.retry_after())
+
+        return wait
+
     def query_provider(self, tracking_number: str, carrier: str) -> list:
         logging.debug(f"Querying provider for {tracking_number} with carrier {carrier}")
 
-        for api_entry in sorted(self.providers, key=lambda x: x[1], reverse=True):
-            api_carrier = api_entry[0]
-            priority = api_entry[1]  # noqa: F841
-            provider = api_entry[2]
-            name = api_entry[3] if len(api_entry) > 3 else None  # noqa: F841
+        if provider := self.get_provider(tracking_number, carrier):
+            time.sleep(self.reserve_request(provider))
 
-            if api_carrier == "*" or api_carrier == carrier:
-                logging.debug(
-                    f"Using provider {provider.__class__.__name__} for {tracking_number} with carrier {carrier}"
-                )
+            with PROVIDER_REQUESTS.time(provider=provider.name):
                 return list(provider.get_status(tracking_number, carrier))
 
-    def notify(self, title, message, urgent=False) -> None:
-        for notifier in self.notifiers:
-            notifier.notify(title, message, urgent)
+    async def query_provider_async(self, tracking_number: str, carrier: str) -> list:
+        logging.debug(f"Querying provider for {tracking_number} with carrier {carrier}")
+
+        if provider := self.get_provider(tracking_number, carrier):
+            await asyncio.sleep(self.reserve_request(provider))
 
-    def notify_event(self, shipment, event, urgent=False) -> None:
-        logging.info(
-            f"New event for {shipment.tracking_number}: {event.event_description} - {event.event_time}"
+            with PROVIDER_REQUESTS.time(provider=provider.name):
+                return await provider.get_status_async(tracking_number, carrier)
+
+    def query_provider_many(self, tracking_numbers: list, carrier: str) -> dict:
+        logging.debug(
+            f"Querying provider for {len(tracking_numbers)} shipments with carrier {carrier}"
         )
-        self.notify(
-            f"New event for {shipment.description or shipment.tracking_number}",
-            event.event_description + " - " + event.event_time,
-            urgent=urgent,
+
+        if provider := self.get_provider(tracking_numbers[0], carrier):
+            time.sleep(self.reserve_request(provider))
+
+            with PROVIDER_REQUESTS.time(provider=provider.name):
+                return provider.get_status_many(tracking_numbers, carrier)
+
+        return {}
+
+    async def query_provider_many_async(self, tracking_numbers: list, carrier: str) -> dict:
+        logging.debug(
+            f"Querying provider for {len(tracking_numbers)} shipments with carrier {carrier}"
         )
 
-    def process_shipment(self, shipment) -> None:
+        if provider := self.get_provider(tracking_numbers[0], carrier):
+            await asyncio.sleep(self.reserve_request(provider))
+
+            with PROVIDER_REQUESTS.time(provider=provider.name):
+                return await provider.get_status_many_async(tracking_numbers, carrier)
+
+        return {}
+
+    def notify(self, title, message, urgent=False) -> None:
+        self.dispatcher.submit(title, message, urgent)
+
+    def notify_events(self, shipment, events) -> None:
+        # The notifications are already in the outbox at this point
+        if shipment.id in self.initial_syncs:
+            self.initial_syncs.discard(shipment.id)
+            logging.info(
+                f"Loaded {len(events)} events for {shipment.tracking_number}, latest: {events[-1].event_description} - {events[-1].local_time()}"
+            )
+
+        else:
+            for event in events:
+                logging.info(
+                    f"New event for {shipment.tracking_number}: {event.event_description} - {event.local_time()}"
+                )
+
+        self.dispatcher.wake()
+
+    def notification_rows(self, shipment, events) -> list:
+        if shipment.id in self.initial_syncs:
+            return self.dispatcher.rows_for_initial_sync(shipment, events)
+
+        return self.dispatcher.rows_for_events(shipment, events)
+
+    def sync_shipment(self, shipment) -> None:
+        """Checks a shipment right away, e.g. right after it has been added.
+
+        The events found are stored in a single transaction, and a new
+        shipment's history results in a single summary notification.
+        """
+        claimed = self.db.claim_shipments(
+            self.worker_id,
+            utcnow(),
+            self.lease_time,
+            1,
+            datetime.max,
+            [shipment.id],
+        )
+
+        if not claimed:
+            logging.info(
+                f"Shipment {shipment.tracking_number} is being checked by another worker"
+            )
+            return
+
+        self.process_shipment(claimed[0])
+        self.writer.flush()
+
+    def check_shipment(self, shipment) -> bool:
         if not shipment.carrier:
             logging.info(
                 f"Shipment {shipment.tracking_number} has no carrier, skipping"
             )
-            return
+            return False
 
         logging.debug(
             f"Checking shipment {shipment.tracking_number} with carrier {shipment.carrier}"
         )
+        return True
+
+    def group_shipments(self, shipments) -> list:
+        """Groups shipments that can be queried in a single request.
+
+        Shipments are grouped by provider and carrier, in groups of up to the
+        provider's batch_size. Shipments whose provider does not support
+        batch queries end up in groups of their own.
+
+        Returns:
+            list: Lists of shipments.
+        """
+        groups = []
+        batches = {}
+
+        for shipment in shipments:
+            provider = shipment.carrier and self.get_provider(
+                shipment.tracking_number, shipment.carrier
+            )
+
+            if not provider or provider.batch_size <= 1:
+                groups.append([shipment])
+                continue
+
+            key = (id(provider), shipment.carrier)
+            batch = batches.get(key)
+
+            if batch is None or len(batch) >= provider.batch_size:
+                batch = batches[key] = []
+                groups.append(batch)
+
+            batch.append(shipment)
 
-        latest_known_event = self.db.get_latest_event(shipment.id)
+        return groups
+
+    def process_shipment(self, shipment) -> None:
+        self.process_shipments([shipment])
+
+    async def process_shipment_async(self, shipment) -> None:
+        await self.process_shipments_async([shipment])
+
+    def process_shipments(self, shipments) -> None:
+        """Queries and processes shipments of the same provider and carrier."""
+        if not (shipments := [s for s in shipments if self.check_shipment(s)]):
+            return
+
+        tracking_numbers = [shipment.tracking_number for shipment in shipments]
+        carrier = shipments[0].carrier
 
         try:
-            events = self.query_provider(shipment.tracking_number, shipment.carrier)
+            if len(shipments) == 1:
+                results = {
+                    tracking_numbers[0]: self.query_provider(
+                        tracking_numbers[0], carrier
+                    )
+                }
+            else:
+                results = self.query_provider_many(tracking_numbers, carrier)
+
         except Exception as e:
-            logging.exception(
-                f"Error querying provider for {shipment.tracking_number}: {e}"
-            )
+            self.handle_query_error(shipments, e)
+            return
+
+        for shipment in shipments:
+            events = results.get(shipment.tracking_number)
+            self.track_response(shipment, events)
+            self.finish_shipment(shipment, self.process_events(shipment, events))
+
+    async def process_shipments_async(self, shipments) -> None:
+        """Queries and processes shipments of the same provider and carrier."""
+        if not (shipments := [s for s in shipments if self.check_shipment(s)]):
+            return
+
+        tracking_numbers = [shipment.tracking_number for shipment in shipments]
+        carrier = shipments[0].carrier
+
+        try:
+            if len(shipments) == 1:
+                results = {
+                    tracking_numbers[0]: await self.query_provider_async(
+                        tracking_numbers[0], carrier
+                    )
+                }
+            else:
+                results = await self.query_provider_many_async(
+                    tracking_numbers, carrier
+                )
+
+        except Exception as e:
+            self.handle_query_error(shipments, e)
+            return
+
+        for shipment in shipments:
+            events = results.get(shipment.tracking_number)
+            self.track_response(shipment, events)
+            self.finish_shipment(shipment, self.process_events(shipment, events))
+
+    def handle_query_error(self, shipments, error: Exception) -> None:
+        tracking_numbers = ", ".join(shipment.tracking_number for shipment in shipments)
+
+        if isinstance(error, RateLimitExceeded):
+            logging.info(f"{error}, deferring {tracking_numbers}")
+            self.report_outcome(shipments, "deferred")
+
+            for shipment in shipments:
+                self.defer_shipment(shipment, error.retry_after)
             return
 
-        events = sorted(events, key=lambda x: x.event_time)
+        logging.error(
+            f"Error querying provider for {tracking_numbers}: {error}",
+            exc_info=error,
+        )
+
+        for shipment in shipments:
+            self.finish_shipment(shipment, [], "error")
+
+    @staticmethod
+    def normalize_events(shipment, events) -> list:
+        """Converts event times that are not datetimes to naive UTC.
+
+        Providers written before event times were stored as datetimes return
+        them as strings, in local time. Events whose time cannot be parsed
+        are skipped.
+        """
+        normalized = []
+
+        for event in events or []:
+            if not isinstance(event.event_time, datetime):
+                try:
+                    event.event_time = BaseProvider.normalize_time(event.event_time)
+                except (TypeError, ValueError, OverflowError) as e:
+                    logging.warning(
+                        f"Skipping event of {shipment.tracking_number} with invalid time {event.event_time!r}: {e}"
+                    )
+                    continue
+
+            normalized.append(event)
+
+        return normalized
+
+    def process_events(self, shipment, events) -> list:
+        """Finds the events of a shipment that are not known yet.
+
+        Advances the shipment's high-water mark (last_event_time,
+        last_event_hash) to the latest event, but does not store anything.
+
+        Returns:
+            list: The new events, oldest first.
+        """
+        events = sorted(
+            self.normalize_events(shipment, events), key=lambda x: x.event_time
+        )
 
         if not events:
             logging.debug(f"No events found for {shipment.tracking_number}")
-            return
+            return []
 
-        if latest_known_event:
+        if shipment.last_event_time:
             logging.debug(
-                f"Latest known event for {shipment.tracking_number}: {latest_known_event.event_description} - {latest_known_event.event_time}"
+                f"Latest known event for {shipment.tracking_number}: {shipment.last_event_time}"
             )
         else:
             logging.debug(f"No known events for {shipment.tracking_number}")
@@ -252,24 +642,344 @@ class Core:
             f"Latest upstream event for {shipment.tracking_number}: {events[-1].event_description} - {events[-1].event_time}"
         )
 
-        for event in events:
-            if (
-                latest_known_event is None
-                or event.event_time > latest_known_event.event_time
-            ):
-                event.shipment_id = shipment.id
-                self.db.write_event(event)
-                self.notify_event(shipment, event, event == events[-1])
+        if events[-1].digest() == shipment.last_event_hash:
+            return []
+
+        new_events = [
+            event
+            for event in events
+            if shipment.last_event_time is None
+            or event.event_time > shipment.last_event_time
+        ]
+
+        for event in new_events:
+            event.shipment_id = shipment.id
+
+        if new_events:
+            # The first check of a new shipment loads its whole history, which
+            # is summarized in a single notification instead
+            if shipment.last_event_time is None and shipment.poll_interval is None:
+                self.initial_syncs.add(shipment.id)
+
+            shipment.last_event_time = new_events[-1].event_time
+            shipment.last_event_hash = new_events[-1].digest()
+
+        return new_events
+
+    def report_outcome(self, shipments, outcome: str) -> None:
+        """Counts the outcome of checking each of the shipments.
+
+        Outcomes are "updated" (new events), "unchanged", "deferred" (rate
+        limited), "error" and "timeout".
+        """
+        for shipment in shipments:
+            provider = self.get_provider(shipment.tracking_number, shipment.carrier)
+            SHIPMENT_CHECKS.inc(provider=provider.name if provider else "", outcome=outcome)
+
+            logging.debug(f"Checked {shipment.tracking_number}: {outcome}")
+
+    def finish_shipment(
+        self, shipment, new_events: list, outcome: Optional[str] = None
+    ) -> None:
+        if outcome is None:
+            outcome = "updated" if new_events else "unchanged"
+
+        self.report_outcome([shipment], outcome)
+        self.reschedule_shipment(shipment, new_events)
+
+    def reschedule_shipment(self, shipment, new_events: list) -> None:
+        next_poll_at = self.scheduler.schedule(shipment, bool(new_events))
+        self.writer.add(shipment, new_events)
+
+        logging.debug(f"Next poll for {shipment.tracking_number} at {next_poll_at}")
+
+    def defer_shipment(self, shipment, delay: float) -> None:
+        """Postpones a shipment that was not polled, without backing off."""
+        next_poll_at = self.scheduler.defer(shipment, delay)
+        self.writer.add(shipment, [])
+
+        logging.debug(f"Deferred {shipment.tracking_number} until {next_poll_at}")
+
+    def due_shipments(self, due_before: Optional[datetime] = None) -> list:
+        """Claims up to claim_size due shipments for this worker.
+
+        Other workers sharing the database will not get these shipments until
+        they have been saved, or until the lease expires after lease_time
+        seconds. Shipments that are still being checked (see in_flight) are
+        never claimed again.
+
+        Returns:
+            list: The claimed shipments, earliest due first.
+        """
+        return self.db.claim_shipments(
+            self.worker_id,
+            utcnow(),
+            self.lease_time,
+            self.claim_size,
+            due_before,
+            exclude=list(self.in_flight),
+        )
+
+    def claimed_shipments(self):
+        """Yields the shipments that are due, claiming them in batches.
+
+        Only shipments due by the start of the cycle are claimed, so that
+        shipments rescheduled during the cycle are not checked again.
+        """
+        due_before = utcnow()
+
+        while shipments := self.due_shipments(due_before):
+            yield shipments
+
+    def seconds_until_due(self) -> float:
+        if (next_due := self.db.get_next_poll_at(utcnow())) is None:
+            return self.loop_interval
+
+        # Wake up at least every loop_interval to pick up new shipments and
+        # expired leases
+        seconds = (next_due - utcnow()).total_seconds()
+        return min(max(seconds, 1), self.loop_interval)
+
+    def archive(self, after: Optional[float] = None, idle_after: Optional[float] = None) -> int:
+        """Moves old shipments to the archive tables and shrinks the database.
+
+        Args:
+            after (float, optional): Archive disabled shipments without
+                events for this many days (default: archive_after).
+            idle_after (float, optional): Archive active shipments without
+                new events for this many days (default: archive_idle_after).
+
+        Returns:
+            int: The number of archived shipments.
+        """
+        after = self.archive_after if after is None else after
+        idle_after = self.archive_idle_after if idle_after is None else idle_after
+
+        now = utcnow()
+        count = self.db.archive_shipments(
+            now - timedelta(days=after),
+            now - timedelta(days=idle_after) if idle_after else None,
+            now,
+        )
+
+        if count:
+            logging.info(f"Archived {count} shipments")
+
+            # A full VACUUM would hold up polling, leave it to the archive
+            # command
+            self.db.vacuum(full=False)
+
+        return count
+
+    def prune_notifications(self, after: Optional[float] = None) -> int:
+        """Deletes notifications that were sent more than `after` days ago.
+
+        Returns:
+            int: The number of deleted notifications.
+        """
+        after = self.notification_retention if after is None else after
+
+        count = self.db.prune_notifications(utcnow() - timedelta(days=after))
+
+        if count:
+            logging.info(f"Deleted {count} sent notifications")
+
+        return count
+
+    def apply_retention(self) -> None:
+        """Archives old shipments and deletes old sent notifications.
+
+        Runs every archive_interval seconds. Each step only runs if enabled
+        (archive_after, notification_retention).
+        """
+        if time.monotonic() < self.next_archive:
+            return
+
+        self.next_archive = time.monotonic() + self.archive_interval
+
+        if self.archive_after:
+            try:
+                self.archive()
+            except Exception as e:
+                logging.exception(f"Error archiving shipments: {e}")
+
+        if self.notification_retention:
+            try:
+                self.prune_notifications()
+            except Exception as e:
+                logging.exception(f"Error deleting sent notifications: {e}")
+
+    def run_cycle(self) -> None:
+        with CYCLE_DURATION.time():
+            try:
+                for claimed in self.claimed_shipments():
+                    for shipments in self.group_shipments(claimed):
+                        CYCLE_SHIPMENTS.inc(len(shipments))
+                        self.process_shipments(shipments)
+
+                    # Release the leases before claiming more
+                    self.writer.flush()
+            finally:
+                self.writer.flush()
+
+    async def process_shipments_with_timeout(self, shipments) -> None:
+        """Checks shipments within shipment_timeout seconds.
+
+        At most `concurrency` groups of shipments are checked at once. Each
+        group gets its own deadline, counted from when it gets its turn. When
+        it passes, the check is cancelled and the next group can start right
+        away. Work that cannot be cancelled (i.e. providers running in a
+        worker thread) carries on in the background. Until it has finished,
+        the shipments stay in `in_flight` so that they are not checked again;
+        they are then rescheduled like after an error.
+        """
+        ids = {shipment.id for shipment in shipments}
+        self.in_flight |= ids
+
+        async with self.slots:
+            task = asyncio.create_task(self.process_shipments_async(shipments))
+
+            try:
+                done, _ = await asyncio.wait({task}, timeout=self.shipment_timeout)
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+
+        if not done:
+            task.cancel()
+            task.add_done_callback(lambda task: self.finish_late(shipments, task))
+
+            provider = self.get_provider(shipments[0].tracking_number, shipments[0].carrier)
+            SHIPMENT_TIMEOUTS.inc(len(shipments), provider=provider.name if provider else "")
+            self.report_outcome(shipments, "timeout")
+
+            logging.warning(
+                f"Timeout while checking {', '.join(s.tracking_number for s in shipments)}"
+            )
+            return
+
+        self.in_flight -= ids
+
+        if (error := task.exception()) is not None:
+            # The shipments keep their lease and are retried once it expires
+            self.forget_responses(shipments)
+            self.report_outcome(shipments, "error")
+            logging.error(
+                f"Error checking {', '.join(s.tracking_number for s in shipments)}: {error}",
+                exc_info=error,
+            )
+
+    def track_response(self, shipment, events) -> None:
+        """Notes whether the provider returned events for a shipment.
+
+        Providers log and swallow most errors, returning no events, so only
+        responses that actually yielded events are remembered in the
+        providers' response caches (see commit_responses()).
+        """
+        if events:
+            self.parsed_responses.add(shipment.id)
+        else:
+            self.parsed_responses.discard(shipment.id)
+
+    def commit_responses(self, shipments) -> None:
+        """Lets the providers remember the responses of stored shipments.
+
+        Called once the shipments have been written. Responses that did not
+        yield any events are not remembered, so they are parsed again next
+        time instead of being reported as unchanged.
+        """
+        for shipment in shipments:
+            if shipment.id not in self.parsed_responses:
+                continue
+
+            self.parsed_responses.discard(shipment.id)
+
+            if provider := self.get_provider(shipment.tracking_number, shipment.carrier):
+                provider.commit_response(shipment.tracking_number, shipment.carrier)
+
+    def forget_responses(self, shipments) -> None:
+        """Makes the providers parse the next response of the shipments."""
+        for shipment in shipments:
+            if provider := self.get_provider(shipment.tracking_number, shipment.carrier):
+                provider.forget_response(shipment.tracking_number, shipment.carrier)
+
+    def finish_late(self, shipments, task: asyncio.Task) -> None:
+        """Reschedules shipments whose check has finished after its deadline."""
+        self.in_flight -= {shipment.id for shipment in shipments}
+
+        # Otherwise, the check finished just in time and rescheduled them
+        if task.cancelled():
+            # The provider may have cached the response whose events are
+            # discarded here, and would report it as unchanged next time
+            self.forget_responses(shipments)
+
+            for shipment in shipments:
+                self.reschedule_shipment(shipment, [])
+        elif error := task.exception():
+            logging.error(f"Error checking shipments after timeout: {error}")
+
+    async def run_cycle_async(self) -> None:
+        with CYCLE_DURATION.time():
+            try:
+                for claimed in self.claimed_shipments():
+                    tasks = []
+                    for shipments in self.group_shipments(claimed):
+                        CYCLE_SHIPMENTS.inc(len(shipments))
+                        tasks.append(self.process_shipments_with_timeout(shipments))
+
+                    # Every task handles its own errors
+                    await asyncio.gather(*tasks)
+
+                    # Release the leases before claiming more
+                    self.writer.flush()
+            finally:
+                self.writer.flush()
+
+    def register_metrics(self) -> None:
+        """Adds gauges reporting the state of the queues to the metrics."""
+        METRICS.gauge(
+            "trackbert_due_shipments",
+            "Number of shipments that are due and not claimed by a worker",
+            function=lambda: self.db.count_due_shipments(utcnow()),
+        )
+        METRICS.gauge(
+            "trackbert_pending_events",
+            "Number of new events waiting to be written to the database",
+            function=lambda: self.writer.pending_events,
+        )
+        METRICS.gauge(
+            "trackbert_pending_notifications",
+            "Number of notifications waiting to be sent, by notifier",
+            ["notifier"],
+            function=lambda: {
+                (notifier,): count
+                for notifier, count in self.db.count_pending_notifications().items()
+            },
+        )
+
+    def start_metrics(self) -> None:
+        """Serves the metrics over HTTP if metrics_port is configured."""
+        if not (port := self.config.getint("Trackbert", "metrics_port", fallback=0)):
+            return
+
+        self.register_metrics()
+
+        try:
+            start_metrics_server(
+                port,
+                self.config.get("Trackbert", "metrics_address", fallback="127.0.0.1"),
+            )
+        except OSError as e:
+            logging.error(f"Could not start metrics server on port {port}: {e}")
 
     def start_loop(self) -> Never:
         logging.debug("Starting loop")
 
         while True:
             try:
-                for shipment in self.db.get_shipments():
-                    self.process_shipment(shipment)
-
-                time.sleep(self.loop_interval)
+                self.run_cycle()
+                self.apply_retention()
+                time.sleep(self.seconds_until_due())
 
             except sqlalchemy.exc.TimeoutError:
                 logging.warning("Database timeout while processing shipments")
@@ -277,6 +987,7 @@ class Core:
 
             except KeyboardInterrupt:
                 logging.info("Keyboard interrupt, exiting")
+                self.dispatcher.close(self.loop_timeout)
                 exit(0)
 
             except Exception as e:
@@ -286,16 +997,9 @@ class Core:
         logging.debug("Starting loop")
 
         while True:
-            tasks = []
-            for shipment in self.db.get_shipments():
-                task = asyncio.wait_for(
-                    asyncio.to_thread(self.process_shipment, shipment),
-                    timeout=self.loop_timeout,
-                )
-                tasks.append(task)
-
             try:
-                await asyncio.gather(*tasks)
+                await self.run_cycle_async()
+                self.apply_retention()
 
             except asyncio.TimeoutError:
                 logging.warning("Timeout while processing shipments")
@@ -305,12 +1009,13 @@ class Core:
 
             except (KeyboardInterrupt, asyncio.CancelledError):
                 logging.info("Keyboard interrupt, exiting")
+                self.dispatcher.close(self.loop_timeout)
                 exit(0)
 
             except Exception as e:
                 logging.exception(f"Unknown error in loop: {e}")
 
-            await asyncio.sleep(self.loop_interval)
+            await asyncio.sleep(self.seconds_until_due())
 
     def _pre_start(self, config: Optional[PathLike] = None):
         self.config_path = config
@@ -330,11 +1035,61 @@ class Core:
         self.db = Database(self.database_uri)
 
         self.loop_interval = self.config.getint("Trackbert", "interval", fallback=60)
+        self.ratelimit_wait = self.config.getint(
+            "Trackbert", "ratelimit_wait", fallback=self.ratelimit_wait
+        )
+
+        self.scheduler = Scheduler.from_config(self.config, self.loop_interval)
+
+        self.worker_id = self.config.get(
+            "Trackbert", "worker_id", fallback=f"{socket.gethostname()}-{os.getpid()}"
+        )
+        self.lease_time = self.config.getfloat("Trackbert", "lease_time", fallback=300)
+        self.claim_size = self.config.getint("Trackbert", "claim_size", fallback=100)
+
+        self.shipment_timeout = self.config.getfloat(
+            "Trackbert", "shipment_timeout", fallback=self.loop_timeout
+        )
+        self.concurrency = self.config.getint("Trackbert", "concurrency", fallback=20)
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.in_flight = set()
+        self.parsed_responses = set()
+
+        self.archive_after = self.config.getfloat("Trackbert", "archive_after", fallback=0)
+        self.archive_idle_after = self.config.getfloat(
+            "Trackbert", "archive_idle_after", fallback=0
+        )
+        self.archive_interval = self.config.getfloat(
+            "Trackbert", "archive_interval", fallback=86400
+        )
+        self.notification_retention = self.config.getfloat(
+            "Trackbert", "notification_retention", fallback=30
+        )
+        self.next_archive = 0
+
+        self.carrier_cache = CarrierCache(
+            self.config.get("Trackbert", "carrier_cache", fallback="carriers.json"),
+            self.config.getfloat("Trackbert", "carrier_cache_ttl", fallback=7 * 86400),
+        )
+
+        self.writer = EventWriter(
+            self.db,
+            self.notify_events,
+            self.config.getint("Trackbert", "write_batch_size", fallback=500),
+            self.config.getfloat("Trackbert", "write_interval", fallback=5),
+            self.notification_rows,
+            self.worker_id,
+            self.commit_responses,
+        )
 
     def start(self, config: Optional[PathLike] = None):
+        self.start_metrics()
+        self.dispatcher.start()
         self.notify("Trackbert", "Starting up")
         self.start_loop()
 
     async def start_async(self, config: Optional[PathLike] = None):
+        self.start_metrics()
+        self.dispatcher.start()
         self.notify("Trackbert", "Starting up")
         await self.start_loop_async()
@@ -3,25 +3,62 @@ from sqlalchemy import (
     Integer,
     String,
     Boolean,
+    DateTime,
+    LargeBinary,
     create_engine,
     ForeignKey,
+    Index,
     event,
+    insert,
+    update,
+    select,
+    delete,
+    exists,
+    and_,
+    or_,
+    text,
+    literal,
+    func,
 )
+from sqlalchemy.exc import DatabaseError
 from sqlalchemy.orm import sessionmaker, relationship, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
 
-from alembic.config import Config
-from alembic import command
-
 import json
 import logging
+import hashlib
+import re
+import uuid
+import zlib
 
-from functools import wraps
+from datetime import datetime, timedelta, timezone
+from functools import wraps, lru_cache
 from pathlib import Path
 
 Base = declarative_base()
 
 
+@lru_cache
+def get_head_revisions() -> frozenset:
+    """Finds the head revisions of the packaged migrations.
+
+    Reads the revision identifiers from the migration scripts directly, which
+    is a lot faster than loading them with Alembic.
+    """
+    revisions, down_revisions = set(), set()
+
+    for script in (Path(__file__).parent.parent / "migrations" / "versions").glob("*.py"):
+        content = script.read_text()
+
+        if match := re.search(r"^revision\b.*=\s*['\"](\w+)['\"]", content, re.M):
+            revisions.add(match.group(1))
+
+        if match := re.search(r"^down_revision\b.*=\s*(.+)$", content, re.M):
+            down_revisions.update(re.findall(r"['\"](\w+)['\"]", match.group(1)))
+
+    return frozenset(revisions - down_revisions)
+
+
 def with_session(func):
     @wraps(func)
     def wrapper(self, *args, **kwargs):
@@ -41,28 +78,162 @@ class Shipment(Base):
     __tablename__ = "shipments"
 
     id = Column(Integer, primary_key=True)
-    tracking_number = Column(String)
+    tracking_number = Column(String, unique=True, index=True)
     carrier = Column(String)
     description = Column(String)
     disabled = Column(Boolean, default=False)
+    next_poll_at = Column(DateTime, index=True)
+    poll_interval = Column(Integer)
+    last_event_time = Column(DateTime)
+    last_event_hash = Column(String)
+    worker_id = Column(String)
+    leased_until = Column(DateTime)
 
     events = relationship("Event")
 
+    @classmethod
+    def claimable(cls, now):
+        """Condition for shipments that are not currently leased by a worker."""
+        return or_(cls.leased_until.is_(None), cls.leased_until < now)
+
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (
+        Index("ix_events_shipment_id_event_time", "shipment_id", "event_time"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    shipment_id = Column(Integer, ForeignKey("shipments.id"))
+    event_time = Column(DateTime)
+    event_description = Column(String)
+
+    # Only loaded when raw_event is accessed
+    payload = relationship("EventPayload", uselist=False, lazy="select")
+
+    @property
+    def raw_event(self):
+        """The event as returned by the provider, decoded from JSON.
+
+        Providers set this to the parsed payload, which is only serialized
+        and compressed when the event is stored. For stored events, the
+        payload is loaded from the event_payloads table on first access.
+        """
+        if "_raw_event" not in self.__dict__:
+            self._raw_event = self.payload.load() if self.payload else None
+
+        return self._raw_event
+
+    @raw_event.setter
+    def raw_event(self, value):
+        self._raw_event = value
+
+    def local_time(self) -> str:
+        return (
+            self.event_time.replace(tzinfo=timezone.utc)
+            .astimezone()
+            .strftime("%Y-%m-%d %H:%M:%S")
+        )
+
+    def digest(self) -> str:
+        return hashlib.sha1(
+            f"{self.event_time}|{self.event_description}".encode("utf-8")
+        ).hexdigest()
+
+
+class EventPayload(Base):
+    """The raw provider payload of an event, stored as compressed JSON.
+
+    Kept out of the events table so that reading events (e.g. to find the
+    latest one of a shipment) does not need to load the payloads, and so
+    that the events table stays small enough to be cached.
+    """
+
+    __tablename__ = "event_payloads"
+
+    event_id = Column(Integer, ForeignKey("events.id"), primary_key=True)
+    data = Column(LargeBinary)
+
+    @staticmethod
+    def dump(raw_event) -> bytes:
+        if not isinstance(raw_event, str):
+            raw_event = json.dumps(raw_event)
+
+        return zlib.compress(raw_event.encode("utf-8"))
+
+    def load(self):
+        return json.loads(zlib.decompress(self.data))
+
+
+class Notification(Base):
+    """A notification waiting to be sent by a notifier, or already sent."""
+
+    __tablename__ = "outbox"
+    __table_args__ = (
+        Index("ix_outbox_notifier_pending", "notifier", "delivered_at", "next_attempt_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     shipment_id = Column(Integer, ForeignKey("shipments.id"))
-    event_time = Column(String)
+    notifier = Column(String)
+    title = Column(String)
+    message = Column(String)
+    urgent = Column(Boolean, default=False)
+    created_at = Column(DateTime)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime)
+    delivered_at = Column(DateTime)
+    last_error = Column(String)
+    claimed_by = Column(String)
+    claimed_until = Column(DateTime)
+
+
+class ArchivedShipment(Base):
+    """A shipment moved out of the shipments table by the retention policy.
+
+    Archived shipments get new ids, as the ids of deleted shipments may be
+    reused. The original id is kept in shipment_id.
+    """
+
+    __tablename__ = "archived_shipments"
+
+    id = Column(Integer, primary_key=True)
+    shipment_id = Column(Integer)
+    tracking_number = Column(String, index=True)
+    carrier = Column(String)
+    description = Column(String)
+    disabled = Column(Boolean)
+    last_event_time = Column(DateTime)
+    archived_at = Column(DateTime)
+
+    events = relationship("ArchivedEvent")
+
+
+class ArchivedEvent(Base):
+    """An event of an archived shipment, along with its compressed payload."""
+
+    __tablename__ = "archived_events"
+
+    id = Column(Integer, primary_key=True)
+    shipment_id = Column(Integer, ForeignKey("archived_shipments.id"), index=True)
+    event_time = Column(DateTime)
     event_description = Column(String)
-    raw_event = Column(String)
+    data = Column(LargeBinary)
 
 
 class Database:
-    def __init__(self, database_uri):
+    def __init__(self, database_uri, migrate=True):
+        """Connects to the database.
+
+        Args:
+            database_uri (str): SQLAlchemy URI of the database.
+            migrate (bool): Whether to upgrade the schema if it is not up to
+                date.
+        """
         self.engine = create_engine(database_uri, pool_size=20, max_overflow=20)
-        self.session = scoped_session(sessionmaker(bind=self.engine))
+        self.session = scoped_session(
+            sessionmaker(bind=self.engine, expire_on_commit=False)
+        )
 
         event.listen(
             self.engine, "connect", lambda _, __: logging.debug("DB connected")
@@ -71,7 +242,19 @@ class Database:
             self.engine, "close", lambda _, __: logging.debug("DB connection closed")
         )
 
-        self.run_migrations()
+        if self.engine.dialect.name == "sqlite":
+            # Lets vacuum() free pages as they are no longer needed, once the
+            # database has been converted, see vacuum()
+            event.listen(
+                self.engine,
+                "connect",
+                lambda connection, _: connection.execute(
+                    "PRAGMA auto_vacuum = INCREMENTAL"
+                ),
+            )
+
+        if migrate and not self.is_up_to_date():
+            self.run_migrations()
 
     @with_session
     def create_shipment(self, session, tracking_number, carrier, description=""):
@@ -111,17 +294,555 @@ class Database:
 
     @with_session
     def get_shipments(self, session, ignore_disabled=True):
-        shipments = session.query(Shipment).all()
+        query = session.query(Shipment)
 
         if ignore_disabled:
-            shipments = [s for s in shipments if not s.disabled]
+            query = query.filter(
+                or_(Shipment.disabled.is_(None), Shipment.disabled.is_(False))
+            )
+
+        # Objects are not expired on commit, so refresh the ones already loaded
+        return query.populate_existing().all()
+
+    @staticmethod
+    def available(now):
+        """Condition for shipments that are active and not leased by a worker."""
+        return and_(
+            or_(Shipment.disabled.is_(None), Shipment.disabled.is_(False)),
+            Shipment.carrier.is_not(None),
+            Shipment.carrier != "",
+            Shipment.claimable(now),
+        )
 
-        return shipments
+    @with_session
+    def claim_shipments(
+        self,
+        session,
+        worker_id,
+        now,
+        lease_time,
+        limit=100,
+        due_before=None,
+        shipment_ids=None,
+        exclude=(),
+    ):
+        """Leases due shipments to a worker.
+
+        Shipments are claimed with a single UPDATE statement that only
+        matches shipments without a valid lease, so that workers sharing the
+        database never claim the same shipment. The lease is released once
+        the shipment's new state has been saved (see save_shipments), or
+        expires after `lease_time` seconds if the worker does not get there,
+        e.g. because it crashed.
+
+        Args:
+            worker_id (str): Identifies the worker.
+            now (datetime): Current time (UTC).
+            lease_time (float): Seconds until the lease expires.
+            limit (int): Maximum number of shipments to claim.
+            due_before (datetime, optional): Only claim shipments due by then
+                (default: now).
+            shipment_ids (list, optional): Only claim these shipments.
+            exclude (list, optional): Never claim these shipments.
+
+        Returns:
+            list: The claimed shipments, earliest due first.
+        """
+        due_before = due_before or now
+        leased_until = now + timedelta(seconds=lease_time)
+
+        candidates = (
+            select(Shipment.id)
+            .where(
+                self.available(now),
+                or_(
+                    Shipment.next_poll_at.is_(None),
+                    Shipment.next_poll_at <= due_before,
+                ),
+            )
+            .order_by(Shipment.next_poll_at.asc().nulls_first(), Shipment.id)
+            .limit(limit)
+        )
 
-    def create_event(self, shipment_id, event_time, event_description, raw_event):
-        if isinstance(raw_event, dict):
-            raw_event = json.dumps(raw_event)
+        if shipment_ids is not None:
+            candidates = candidates.where(Shipment.id.in_(shipment_ids))
+
+        if exclude:
+            candidates = candidates.where(Shipment.id.not_in(exclude))
 
+        session.execute(
+            update(Shipment)
+            .where(Shipment.id.in_(candidates), self.available(now))
+            .values(worker_id=worker_id, leased_until=leased_until)
+            .execution_options(synchronize_session=False)
+        )
+
+        # Objects are not expired on commit, so refresh the ones already loaded
+        return (
+            session.query(Shipment)
+            .filter(
+                Shipment.worker_id == worker_id,
+                Shipment.leased_until == leased_until,
+            )
+            .order_by(Shipment.next_poll_at.asc().nulls_first(), Shipment.id)
+            .populate_existing()
+            .all()
+        )
+
+    @with_session
+    def get_next_poll_at(self, session, now):
+        """Returns when the next shipment is due, or None if none is active.
+
+        Shipments that have never been polled are due right away.
+        """
+        row = session.execute(
+            select(Shipment.next_poll_at)
+            .where(self.available(now))
+            .order_by(Shipment.next_poll_at.asc().nulls_first())
+            .limit(1)
+        ).first()
+
+        if row is not None:
+            return row[0] or now
+
+    @with_session
+    def count_due_shipments(self, session, now) -> int:
+        return session.scalar(
+            select(func.count())
+            .select_from(Shipment)
+            .where(
+                self.available(now),
+                or_(Shipment.next_poll_at.is_(None), Shipment.next_poll_at <= now),
+            )
+        )
+
+    @with_session
+    def save_shipments(
+        self, session, shipments, new_events, notifications=(), worker_id=None
+    ):
+        """Stores the state of many shipments and their new events at once.
+
+        Uses a single transaction and executemany-style statements, so writing
+        a whole cycle costs a single commit. Notifications about the new
+        events are added to the outbox in the same transaction, so they are
+        neither lost nor duplicated if anything fails.
+
+        Args:
+            shipments (list): The shipments to update.
+            new_events (list): The new events of these shipments.
+            notifications (list): Outbox rows (as dicts) to add.
+            worker_id (str, optional): Releases the leases of this worker on
+                the shipments.
+        """
+        if notifications:
+            session.execute(insert(Notification), list(notifications))
+
+        if new_events:
+            new_events = list(new_events)
+
+            rows = [
+                {
+                    "shipment_id": event.shipment_id,
+                    "event_time": event.event_time,
+                    "event_description": event.event_description,
+                }
+                for event in new_events
+            ]
+
+            if self.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+                # Returns the ids in the order of the events, to store the
+                # payloads along with them
+                event_ids = session.scalars(
+                    insert(Event).returning(Event.id, sort_by_parameter_order=True),
+                    rows,
+                ).all()
+            else:
+                # E.g. MySQL, which does not support RETURNING
+                event_ids = [
+                    session.execute(insert(Event).values(row)).inserted_primary_key[0]
+                    for row in rows
+                ]
+
+            payloads = [
+                {"event_id": event_id, "data": EventPayload.dump(event.raw_event)}
+                for event_id, event in zip(event_ids, new_events)
+                if event.raw_event is not None
+            ]
+
+            if payloads:
+                session.execute(insert(EventPayload), payloads)
+
+        if shipments:
+            session.bulk_update_mappings(
+                Shipment,
+                [
+                    {
+                        "id": shipment.id,
+                        "next_poll_at": shipment.next_poll_at,
+                        "poll_interval": shipment.poll_interval,
+                        "last_event_time": shipment.last_event_time,
+                        "last_event_hash": shipment.last_event_hash,
+                    }
+                    for shipment in shipments
+                ],
+            )
+
+            if worker_id is not None:
+                session.execute(
+                    update(Shipment)
+                    .where(
+                        Shipment.id.in_([shipment.id for shipment in shipments]),
+                        Shipment.worker_id == worker_id,
+                    )
+                    .values(worker_id=None, leased_until=None)
+                    .execution_options(synchronize_session=False)
+                )
+
+    @with_session
+    def upsert_shipments(self, session, shipments):
+        """Creates or updates many shipments in a single transaction.
+
+        Shipments are identified by their tracking number. Existing shipments
+        are only updated with the fields present in the given dicts.
+
+        Args:
+            shipments (list): Dicts of Shipment fields, each with at least a
+                tracking_number. If a tracking number appears more than once,
+                the last one wins.
+
+        Returns:
+            tuple: The number of created and updated shipments.
+        """
+        shipments = {shipment["tracking_number"]: shipment for shipment in shipments}
+        tracking_numbers = list(shipments)
+
+        existing = {}
+
+        # Stay below the maximum number of SQL parameters of older SQLite
+        for i in range(0, len(tracking_numbers), 500):
+            existing.update(
+                session.query(Shipment.tracking_number, Shipment.id)
+                .filter(Shipment.tracking_number.in_(tracking_numbers[i : i + 500]))
+                .all()
+            )
+
+        new_shipments = [
+            shipment
+            for tracking_number, shipment in shipments.items()
+            if tracking_number not in existing
+        ]
+        updated_shipments = [
+            {**shipment, "id": existing[tracking_number]}
+            for tracking_number, shipment in shipments.items()
+            if tracking_number in existing
+        ]
+
+        if new_shipments:
+            session.execute(insert(Shipment), new_shipments)
+
+        if updated_shipments:
+            session.bulk_update_mappings(Shipment, updated_shipments)
+
+        return len(new_shipments), len(updated_shipments)
+
+    def export_shipments(self, with_events=False, batch_size=1000):
+        """Streams all shipments, optionally along with their events.
+
+        Rows are fetched from the database in batches as they are consumed,
+        so that memory use does not grow with the size of the database.
+
+        Yields:
+            Row: The shipment fields (id, tracking_number, carrier,
+                description, disabled), with event_time and
+                event_description if `with_events` is set. Ordered by
+                shipment, and by event time within a shipment.
+        """
+        columns = [
+            Shipment.id,
+            Shipment.tracking_number,
+            Shipment.carrier,
+            Shipment.description,
+            Shipment.disabled,
+        ]
+
+        if with_events:
+            query = (
+                select(*columns, Event.event_time, Event.event_description)
+                .outerjoin(Event, Event.shipment_id == Shipment.id)
+                .order_by(Shipment.id, Event.event_time)
+            )
+        else:
+            query = select(*columns).order_by(Shipment.id)
+
+        with self.engine.connect() as connection:
+            yield from connection.execution_options(yield_per=batch_size).execute(query)
+
+    @with_session
+    def archive_shipments(self, session, inactive_before, idle_before=None, now=None, batch_size=500):
+        """Moves old shipments and their events to the archive tables.
+
+        Archives disabled shipments (and those without a carrier) whose
+        latest event is older than `inactive_before`, or which have no
+        events. If `idle_before` is given, active shipments without new
+        events since then are archived as well, as they have most likely
+        been delivered.
+
+        Shipments with notifications that have not been sent yet are kept
+        until they have been sent, and shipments leased by a worker until
+        the worker has saved them. Sent notifications of archived shipments
+        are deleted.
+
+        Args:
+            inactive_before (datetime): Cutoff for disabled shipments (UTC).
+            idle_before (datetime, optional): Cutoff for active shipments (UTC).
+            now (datetime, optional): Time of archiving (UTC).
+            batch_size (int): Number of shipments to move per statement.
+
+        Returns:
+            int: The number of archived shipments.
+        """
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+
+        inactive = or_(
+            Shipment.disabled.is_(True),
+            Shipment.carrier.is_(None),
+            Shipment.carrier == "",
+        )
+        condition = and_(
+            inactive,
+            or_(
+                Shipment.last_event_time.is_(None),
+                Shipment.last_event_time < inactive_before,
+            ),
+        )
+
+        if idle_before is not None:
+            condition = or_(condition, Shipment.last_event_time < idle_before)
+
+        pending = exists().where(
+            Notification.shipment_id == Shipment.id,
+            Notification.delivered_at.is_(None),
+        )
+
+        # Lease the shipments first, so that no worker claims them while they
+        # are being moved
+        archiver = f"archive-{uuid.uuid4().hex}"
+
+        session.execute(
+            update(Shipment)
+            .where(condition, ~pending, Shipment.claimable(now))
+            .values(worker_id=archiver, leased_until=now)
+            .execution_options(synchronize_session=False)
+        )
+
+        shipment_ids = session.scalars(
+            select(Shipment.id)
+            .where(Shipment.worker_id == archiver)
+            .order_by(Shipment.id)
+        ).all()
+
+        for i in range(0, len(shipment_ids), batch_size):
+            batch = shipment_ids[i : i + batch_size]
+
+            session.execute(
+                insert(ArchivedShipment).from_select(
+                    [
+                        "shipment_id",
+                        "tracking_number",
+                        "carrier",
+                        "description",
+                        "disabled",
+                        "last_event_time",
+                        "archived_at",
+                    ],
+                    select(
+                        Shipment.id,
+                        Shipment.tracking_number,
+                        Shipment.carrier,
+                        Shipment.description,
+                        Shipment.disabled,
+                        Shipment.last_event_time,
+                        literal(now, DateTime),
+                    ).where(Shipment.id.in_(batch)),
+                )
+            )
+
+            session.execute(
+                insert(ArchivedEvent).from_select(
+                    ["shipment_id", "event_time", "event_description", "data"],
+                    select(
+                        ArchivedShipment.id,
+                        Event.event_time,
+                        Event.event_description,
+                        EventPayload.data,
+                    )
+                    .join(
+                        ArchivedShipment,
+                        and_(
+                            ArchivedShipment.shipment_id == Event.shipment_id,
+                            ArchivedShipment.archived_at == now,
+                        ),
+                    )
+                    .outerjoin(EventPayload, EventPayload.event_id == Event.id)
+                    .where(Event.shipment_id.in_(batch))
+                    .order_by(Event.id),
+                )
+            )
+
+            session.execute(
+                delete(EventPayload).where(
+                    EventPayload.event_id.in_(
+                        select(Event.id).where(Event.shipment_id.in_(batch))
+                    )
+                )
+            )
+            session.execute(delete(Event).where(Event.shipment_id.in_(batch)))
+            session.execute(
+                delete(Notification).where(Notification.shipment_id.in_(batch))
+            )
+            session.execute(delete(Shipment).where(Shipment.id.in_(batch)))
+
+        return len(shipment_ids)
+
+    def vacuum(self, full: bool = True) -> None:
+        """Returns free pages of an SQLite database to the file system.
+
+        Databases created before incremental vacuum was enabled are
+        converted by a full VACUUM the first time, which may take a while.
+        Does nothing for other databases.
+
+        Args:
+            full (bool): Whether to convert the database if needed. If not,
+                databases that have not been converted yet are left alone.
+        """
+        if self.engine.dialect.name != "sqlite":
+            return
+
+        with self.engine.connect() as connection:
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+
+            if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+                if not full:
+                    logging.info(
+                        "Run trackbert archive once to enable incremental vacuum"
+                    )
+                    return
+
+                logging.info("Enabling incremental vacuum, this may take a while")
+                connection.exec_driver_sql("VACUUM")
+            else:
+                # Frees one page per step, so run it to completion rather
+                # than just executing it
+                connection.connection.driver_connection.executescript(
+                    "PRAGMA incremental_vacuum;"
+                )
+
+    @with_session
+    def add_notifications(self, session, notifications):
+        session.execute(insert(Notification), list(notifications))
+
+    @with_session
+    def claim_notifications(
+        self, session, notifier, worker_id, now, lease_time, limit=50
+    ):
+        """Leases pending notifications of a notifier to a worker for sending.
+
+        Like claim_shipments(), so that workers sharing the database never
+        send the same notification. The lease ends when the notification is
+        marked as delivered or failed, or after `lease_time` seconds.
+
+        Returns:
+            list: The claimed notifications, oldest first.
+        """
+        claimed_until = now + timedelta(seconds=lease_time)
+
+        pending = and_(
+            Notification.notifier == notifier,
+            Notification.delivered_at.is_(None),
+            or_(
+                Notification.next_attempt_at.is_(None),
+                Notification.next_attempt_at <= now,
+            ),
+            or_(
+                Notification.claimed_until.is_(None),
+                Notification.claimed_until < now,
+            ),
+        )
+
+        session.execute(
+            update(Notification)
+            .where(
+                Notification.id.in_(
+                    select(Notification.id)
+                    .where(pending)
+                    .order_by(Notification.id)
+                    .limit(limit)
+                ),
+                pending,
+            )
+            .values(claimed_by=worker_id, claimed_until=claimed_until)
+            .execution_options(synchronize_session=False)
+        )
+
+        return (
+            session.query(Notification)
+            .filter(
+                Notification.claimed_by == worker_id,
+                Notification.claimed_until == claimed_until,
+                Notification.delivered_at.is_(None),
+            )
+            .order_by(Notification.id)
+            .populate_existing()
+            .all()
+        )
+
+    @with_session
+    def count_pending_notifications(self, session) -> dict:
+        """Returns the number of notifications not sent yet, by notifier."""
+        return dict(
+            session.query(Notification.notifier, func.count())
+            .filter(Notification.delivered_at.is_(None))
+            .group_by(Notification.notifier)
+            .all()
+        )
+
+    @with_session
+    def mark_notification_delivered(self, session, notification_id, now):
+        session.execute(
+            update(Notification)
+            .where(Notification.id == notification_id)
+            .values(delivered_at=now, claimed_by=None, claimed_until=None)
+        )
+
+    @with_session
+    def prune_notifications(self, session, delivered_before) -> int:
+        """Deletes notifications that were sent before the given time.
+
+        Returns:
+            int: The number of deleted notifications.
+        """
+        return session.execute(
+            delete(Notification).where(
+                Notification.delivered_at.is_not(None),
+                Notification.delivered_at < delivered_before,
+            )
+        ).rowcount
+
+    @with_session
+    def mark_notification_failed(self, session, notification_id, attempts, next_attempt_at, error):
+        session.execute(
+            update(Notification)
+            .where(Notification.id == notification_id)
+            .values(
+                attempts=attempts,
+                next_attempt_at=next_attempt_at,
+                last_error=error,
+                claimed_by=None,
+                claimed_until=None,
+            )
+        )
+
+    def create_event(self, shipment_id, event_time, event_description, raw_event):
         new_event = Event(
             shipment_id=shipment_id,
             event_time=event_time,
@@ -132,6 +853,9 @@ class Database:
 
     @with_session
     def write_event(self, session, event):
+        if event.raw_event is not None:
+            event.payload = EventPayload(data=EventPayload.dump(event.raw_event))
+
         session.add(event)
         session.commit()
 
@@ -150,7 +874,22 @@ class Database:
         )
         return event
 
+    def get_current_revisions(self) -> set:
+        """Returns the revisions stored in the database's alembic_version table."""
+        try:
+            with self.engine.connect() as connection:
+                rows = connection.execute(text("SELECT version_num FROM alembic_version"))
+                return {row[0] for row in rows}
+        except DatabaseError:
+            return set()
+
+    def is_up_to_date(self) -> bool:
+        return self.get_current_revisions() == get_head_revisions()
+
     def make_migration(self, message):
+        from alembic.config import Config
+        from alembic import command
+
         alembic_cfg = Config(Path(__file__).parent.parent / "alembic.ini")
         alembic_cfg.set_main_option(
             "sqlalchemy.url", self.engine.url.__to_string__(hide_password=False)
@@ -160,6 +899,9 @@ class Database:
         command.revision(alembic_cfg, message=message, autogenerate=True)
 
     def run_migrations(self):
+        from alembic.config import Config
+        from alembic import command
+
         alembic_cfg = Config(Path(__file__).parent.parent / "alembic.ini")
         alembic_cfg.set_main_option(
             "sqlalchemy.url", self.engine.url.__to_string__(hide_password=False)
@@ -0,0 +1,212 @@
+from typing import Optional
+from datetime import timedelta
+
+import logging
+import threading
+import uuid
+
+from .database import Database
+from .metrics import NOTIFICATIONS
+from .scheduler import utcnow
+
+
+class NotificationDispatcher:
+    """Delivers notifications from the outbox table.
+
+    Notifications are stored in the outbox (one row per notifier) in the same
+    transaction as the events they are about, and sent later by one worker
+    thread per notifier. A slow or failing notifier therefore neither holds
+    up checking shipments nor delays the other notifiers.
+
+    Each worker sends up to `batch_size` pending notifications at a time and
+    marks every one as delivered right after sending it. Failed deliveries
+    are retried after `retry_delay` seconds, doubling with every attempt up
+    to `max_retry_delay`. Workers wake up when new notifications are added,
+    and otherwise check the outbox every `poll_interval` seconds.
+
+    Notifications are leased to `worker_id` for `lease_time` seconds before
+    they are sent, so that several processes sharing the database do not send
+    the same notification.
+
+    The workers only run after start() has been called, so that short-lived
+    processes (like the command line interface adding a shipment) leave
+    delivery to the main loop.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        notifiers: list,
+        batch_size: int = 50,
+        retry_delay: float = 30,
+        max_retry_delay: float = 3600,
+        poll_interval: float = 30,
+        worker_id: Optional[str] = None,
+        lease_time: float = 300,
+    ):
+        self.db = db
+        self.notifiers = notifiers
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self.lease_time = lease_time
+
+        self.stopping = False
+        self.wakeups = {
+            self.notifier_name(notifier): threading.Event() for notifier in notifiers
+        }
+        self.workers = []
+
+    def start(self) -> None:
+        for notifier in self.notifiers:
+            worker = threading.Thread(
+                target=self.work,
+                args=(notifier,),
+                name=f"notifier-{self.notifier_name(notifier)}",
+                daemon=True,
+            )
+            self.workers.append(worker)
+            worker.start()
+
+    @staticmethod
+    def notifier_name(notifier) -> str:
+        return notifier.__class__.__name__
+
+    def rows(self, title: str, message: str, urgent: bool = False, shipment_id=None) -> list:
+        """Creates outbox rows for a notification, one per notifier."""
+        now = utcnow()
+
+        return [
+            {
+                "shipment_id": shipment_id,
+                "notifier": self.notifier_name(notifier),
+                "title": title,
+                "message": message,
+                "urgent": urgent,
+                "created_at": now,
+                "attempts": 0,
+            }
+            for notifier in self.notifiers
+        ]
+
+    def rows_for_events(self, shipment, events: list) -> list:
+        """Creates outbox rows for a single notification about new events.
+
+        Args:
+            shipment (Shipment): The shipment the events belong to.
+            events (list): The new events, oldest first.
+        """
+        if not events:
+            return []
+
+        title, message = self.format_events(shipment, events)
+        return self.rows(title, message, True, shipment.id)
+
+    def rows_for_initial_sync(self, shipment, events: list) -> list:
+        """Creates outbox rows summarizing the history of a new shipment."""
+        if not events:
+            return []
+
+        name = shipment.description or shipment.tracking_number
+        latest = events[-1]
+
+        return self.rows(
+            f"Now tracking {name}",
+            f"{len(events)} events so far, latest: {latest.event_description} - {latest.local_time()}",
+            False,
+            shipment.id,
+        )
+
+    @staticmethod
+    def format_events(shipment, events: list):
+        name = shipment.description or shipment.tracking_number
+
+        if len(events) == 1:
+            title = f"New event for {name}"
+        else:
+            title = f"{len(events)} new events for {name}"
+
+        message = "\n".join(
+            f"{event.event_description} - {event.local_time()}" for event in events
+        )
+
+        return title, message
+
+    def submit(self, title: str, message: str, urgent: bool = False) -> None:
+        """Adds a notification to the outbox."""
+        if rows := self.rows(title, message, urgent):
+            self.db.add_notifications(rows)
+            self.wake()
+
+    def wake(self) -> None:
+        """Makes the workers check the outbox right away."""
+        for wakeup in self.wakeups.values():
+            wakeup.set()
+
+    def work(self, notifier) -> None:
+        wakeup = self.wakeups[self.notifier_name(notifier)]
+
+        while True:
+            wakeup.clear()
+
+            try:
+                delivered = self.deliver(notifier)
+            except Exception as e:
+                logging.error(f"Error reading the notification outbox: {e}")
+                delivered = 0
+
+            if self.stopping:
+                return
+
+            # Keep going while there is a backlog
+            if delivered < self.batch_size:
+                wakeup.wait(self.poll_interval)
+
+    def deliver(self, notifier) -> int:
+        """Sends the pending notifications of a notifier.
+
+        Returns:
+            int: The number of notifications processed.
+        """
+        name = self.notifier_name(notifier)
+        notifications = self.db.claim_notifications(
+            name, self.worker_id, utcnow(), self.lease_time, self.batch_size
+        )
+
+        for notification in notifications:
+            try:
+                with NOTIFICATIONS.time(notifier=name):
+                    notifier.notify(
+                        notification.title, notification.message, notification.urgent
+                    )
+
+            except Exception as e:
+                attempts = (notification.attempts or 0) + 1
+                delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+
+                logging.error(
+                    f"Error sending notification {notification.id} with {name} "
+                    f"(attempt {attempts}, retrying in {delay:.0f}s): {e}"
+                )
+
+                self.db.mark_notification_failed(
+                    notification.id,
+                    attempts,
+                    utcnow() + timedelta(seconds=delay),
+                    str(e),
+                )
+                continue
+
+            self.db.mark_notification_delivered(notification.id, utcnow())
+
+        return len(notifications)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Sends the pending notifications and stops the workers."""
+        self.stopping = True
+        self.wake()
+
+        for worker in self.workers:
+            worker.join(timeout)
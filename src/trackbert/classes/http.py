@@ -1,6 +1,189 @@
-from urllib.request import Request, urlopen
+from urllib.request import (
+    Request,
+    HTTPHandler,
+    HTTPSHandler,
+    build_opener,
+    getproxies,
+    install_opener,
+    proxy_bypass,
+    urlopen,
+)
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit, urljoin
+from urllib.response import addinfourl
+from http.client import HTTPConnection, HTTPSConnection, HTTPException, parse_headers
+from io import BytesIO
+from collections import OrderedDict
 
+import asyncio
+import gzip
+import hashlib
 import json
+import socket
+import ssl
+import threading
+import time
+
+
+class ConnectionPool:
+    """Pool of keep-alive connections, shared by all threads.
+
+    Idle connections are kept per (scheme, host, port) and reused for later
+    requests to the same host, saving the TCP and TLS handshakes. Connections
+    that have been idle for longer than `max_idle_time` seconds are discarded,
+    as most servers will have closed them by then.
+    """
+
+    def __init__(self, max_idle: int = 20, max_idle_time: float = 30):
+        self.max_idle = max_idle
+        self.max_idle_time = max_idle_time
+
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            connections = self.idle.get(key, [])
+
+            while connections:
+                connection, last_used = connections.pop()
+
+                if time.monotonic() - last_used < self.max_idle_time:
+                    return connection
+
+                connection.close()
+
+    def put(self, key, connection) -> None:
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+
+            if len(connections) < self.max_idle:
+                connections.append((connection, time.monotonic()))
+                return
+
+        connection.close()
+
+    def clear(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, {}
+
+        for connections in idle.values():
+            for connection in connections:
+                connection[0].close()
+
+
+class PooledResponse(addinfourl):
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+
+class KeepAliveMixin:
+    connection_class = HTTPConnection
+
+    def __init__(self, pool: ConnectionPool, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = pool
+
+    def connect(self, host, timeout):
+        return self.connection_class(host, timeout=timeout)
+
+    def do_open(self, http_class, req, **http_conn_args):
+        # Tunnelling through proxies is left to urllib
+        if req._tunnel_host:
+            return super().do_open(http_class, req, **http_conn_args)
+
+        if not req.host:
+            raise URLError("no host given")
+
+        key = (req.type, req.host)
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers["Connection"] = "keep-alive"
+        headers = {name.title(): value for name, value in headers.items()}
+
+        timeout = req.timeout
+        if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+            timeout = socket.getdefaulttimeout()
+
+        while True:
+            connection = self.pool.get(key)
+            reused = connection is not None
+
+            if not reused:
+                connection = self.connect(req.host, timeout)
+            elif connection.sock is not None:
+                connection.sock.settimeout(timeout)
+
+            try:
+                connection.request(
+                    req.get_method(),
+                    req.selector,
+                    req.data,
+                    headers,
+                    encode_chunked=req.has_header("Transfer-encoding"),
+                )
+                response = connection.getresponse()
+                body = response.read()
+
+            except (HTTPException, OSError) as e:
+                connection.close()
+
+                if isinstance(e, socket.timeout):
+                    raise
+
+                # The server may have closed an idle connection, so retry
+                # with a new one
+                if reused:
+                    continue
+
+                raise URLError(e)
+
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.pool.put(key, connection)
+
+        result = PooledResponse(
+            BytesIO(body), response.msg, req.get_full_url(), response.status
+        )
+        result.msg = response.reason
+        result.reason = response.reason
+        return result
+
+
+class KeepAliveHTTPHandler(KeepAliveMixin, HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(HTTPConnection, req)
+
+
+class KeepAliveHTTPSHandler(KeepAliveMixin, HTTPSHandler):
+    connection_class = HTTPSConnection
+
+    def connect(self, host, timeout):
+        # Share one context instead of loading the CA certificates for every
+        # connection
+        if self._context is None:
+            self._context = ssl.create_default_context()
+
+        return self.connection_class(host, timeout=timeout, context=self._context)
+
+    def https_open(self, req):
+        return self.do_open(HTTPSConnection, req, context=self._context)
+
+
+POOL = ConnectionPool()
+
+
+def install_keepalive(pool: ConnectionPool = POOL) -> None:
+    """Makes urllib reuse connections from the pool.
+
+    This installs a global opener, so it also applies to requests made by the
+    API client libraries used by the providers, which all use urlopen().
+    """
+    install_opener(build_opener(KeepAliveHTTPHandler(pool), KeepAliveHTTPSHandler(pool)))
 
 
 class HTTPRequest(Request):
@@ -19,3 +202,436 @@ class HTTPRequest(Request):
     def add_json_payload(self, payload: dict):
         self.add_header("Content-Type", "application/json")
         self.data = json.dumps(payload).encode("utf-8")
+
+
+class ResponseCache:
+    """Remembers the last response for each shipment to detect changes.
+
+    Where the API supports it, the ETag and Last-Modified headers of the last
+    response are sent along with the next request, so the server can answer
+    with 304 Not Modified. Otherwise, a hash of the response body is compared
+    to the previous one. Either way, an unchanged response is reported as
+    None, so that it does not need to be parsed at all.
+
+    A new response is only remembered once commit() is called for it, i.e.
+    once its events have been stored. Until then, the same response is
+    reported as changed again, so that its events are not lost if parsing or
+    storing them fails.
+
+    Only the most recently used `max_entries` shipments are remembered.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+
+        self.entries = OrderedDict()
+        self.pending = OrderedDict()
+        self.lock = threading.Lock()
+
+    def prepare(self, key, request: Request) -> None:
+        """Adds conditional headers for the last response to a request."""
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is None:
+            return
+
+        etag, last_modified, _ = entry
+
+        if etag:
+            request.add_header("If-None-Match", etag)
+        if last_modified:
+            request.add_header("If-Modified-Since", last_modified)
+
+    def store(self, key, body: bytes, headers=None) -> bool:
+        """Records a response, to be remembered once commit() is called.
+
+        Args:
+            key: Identifies the shipment, e.g. (carrier, tracking_number).
+            body (bytes): The response body.
+            headers: The response headers, if any.
+
+        Returns:
+            bool: Whether the body differs from the remembered response.
+        """
+        digest = hashlib.sha1(body).hexdigest()
+
+        etag = headers.get("ETag") if headers else None
+        last_modified = headers.get("Last-Modified") if headers else None
+
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            changed = previous is None or previous[2] != digest
+
+            if changed:
+                if previous is not None:
+                    self.entries[key] = previous
+
+                self.pending.pop(key, None)
+                self.pending[key] = (etag, last_modified, digest)
+                self.trim(self.pending)
+            else:
+                self.entries[key] = (etag, last_modified, digest)
+
+        return changed
+
+    def commit(self, *keys) -> None:
+        """Remembers the last responses for the given keys.
+
+        Called once the events of the responses have been stored.
+        """
+        with self.lock:
+            for key in keys:
+                if (entry := self.pending.pop(key, None)) is not None:
+                    self.entries.pop(key, None)
+                    self.entries[key] = entry
+
+            self.trim(self.entries)
+
+    def trim(self, entries: OrderedDict) -> None:
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def discard(self, *keys) -> None:
+        """Forgets the last response for the given keys.
+
+        Used when the events of a response could not be used, so that the
+        same response is not reported as unchanged next time.
+        """
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+                self.pending.pop(key, None)
+
+    def touch(self, key) -> None:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+
+    def execute(self, key, request: Request, load_json: bool = True):
+        """Executes a request, unless its response has not changed.
+
+        Returns:
+            The (decoded) response, or None if it is unchanged.
+        """
+        self.prepare(key, request)
+
+        try:
+            response = urlopen(request)
+        except HTTPError as e:
+            if e.code == 304:
+                self.touch(key)
+                return None
+            raise
+
+        body = response.read()
+
+        if not self.store(key, body, response.headers):
+            return None
+
+        return json.loads(body) if load_json else body
+
+    async def execute_async(
+        self, key, request: Request, load_json: bool = True, timeout: float | None = None
+    ):
+        """Asynchronous version of execute()."""
+        request = AsyncHTTPRequest.from_request(request)
+        self.prepare(key, request)
+
+        status, headers, body = await asyncio.wait_for(
+            request.fetch_response(), request.timeout if timeout is None else timeout
+        )
+
+        if status == 304:
+            self.touch(key)
+            return None
+
+        if not self.store(key, body, headers):
+            return None
+
+        return json.loads(body) if load_json else body
+
+
+class AsyncConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+
+    def close(self) -> None:
+        try:
+            self.writer.close()
+        except RuntimeError:
+            # The event loop the connection belongs to is already closed
+            pass
+
+
+class AsyncConnectionPool(ConnectionPool):
+    """Pool of keep-alive connections for AsyncHTTPRequest.
+
+    Connections belong to the event loop they were opened in, so connections
+    of other loops are discarded instead of being reused.
+    """
+
+    ssl_context = None
+
+    def get(self, key):
+        while connection := super().get(key):
+            if (
+                connection.loop is asyncio.get_running_loop()
+                and not connection.writer.is_closing()
+            ):
+                return connection
+
+            connection.close()
+
+    async def connect(self, key) -> AsyncConnection:
+        scheme, host, port = key
+
+        if scheme == "https" and self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+
+        reader, writer = await asyncio.open_connection(
+            host, port, ssl=self.ssl_context if scheme == "https" else None
+        )
+
+        return AsyncConnection(reader, writer)
+
+
+ASYNC_POOL = AsyncConnectionPool()
+
+
+class AsyncHTTPRequest(HTTPRequest):
+    """HTTPRequest that is executed on the running event loop.
+
+    Speaks just enough HTTP/1.1 over asyncio streams to talk to the JSON APIs
+    used by the built-in providers, so that many requests can be in flight at
+    the same time without occupying a thread each.
+    """
+
+    MAX_REDIRECTS = 5
+
+    # Seconds until a request is given up, including redirects
+    timeout: float = 30
+
+    pool = ASYNC_POOL
+
+    @classmethod
+    def from_request(cls, request: Request) -> "AsyncHTTPRequest":
+        """Create an AsyncHTTPRequest from an existing urllib Request.
+
+        This allows executing requests prepared by the API client libraries
+        (which all build on urllib) asynchronously.
+
+        Args:
+            request (Request): The request to copy URL, method, headers and
+                payload from.
+
+        Returns:
+            AsyncHTTPRequest: The asynchronous equivalent of the request.
+        """
+        new_request = cls(request.full_url, data=request.data, method=request.get_method())
+
+        for key, value in request.header_items():
+            new_request.add_header(key, value)
+
+        return new_request
+
+    async def execute(self, load_json: bool = True, timeout: float | None = None):
+        response = await asyncio.wait_for(
+            self.fetch(), self.timeout if timeout is None else timeout
+        )
+        if load_json:
+            response = json.loads(response)
+        return response
+
+    async def fetch(self) -> bytes:
+        _, _, body = await self.fetch_response()
+        return body
+
+    async def fetch_response(self):
+        """Executes the request, following redirects.
+
+        Redirects are followed like urllib does: after a 303 (or a 301 or 302
+        in response to a POST), the request is repeated as a GET without a
+        body.
+
+        Requests that should go through a proxy (see urllib's getproxies())
+        are sent with urllib in a worker thread instead.
+
+        Returns:
+            tuple: The status code, headers and body of the response.
+
+        Raises:
+            HTTPError: If the server responds with an error status.
+        """
+        url = self.full_url
+        method = self.get_method()
+        data = self.data
+
+        for _ in range(self.MAX_REDIRECTS + 1):
+            if self.proxied(url):
+                return await asyncio.get_running_loop().run_in_executor(
+                    None, self._fetch_with_urllib, url, method, data
+                )
+
+            status, reason, headers, body = await self._roundtrip(url, method, data)
+
+            if status in (301, 302, 303, 307, 308) and "Location" in headers:
+                if status in (301, 302, 303) and method not in ("GET", "HEAD"):
+                    if status == 303 or method == "POST":
+                        method, data = "GET", None
+                    else:
+                        raise HTTPError(url, status, reason, headers, BytesIO(body))
+
+                url = urljoin(url, headers["Location"])
+                continue
+
+            if status >= 400:
+                raise HTTPError(url, status, reason, headers, BytesIO(body))
+
+            return status, headers, body
+
+        raise HTTPError(url, status, "Too many redirects", headers, BytesIO(body))
+
+    @staticmethod
+    def proxied(url: str) -> bool:
+        """Whether the environment configures a proxy for the URL."""
+        parts = urlsplit(url)
+        return parts.scheme in getproxies() and not proxy_bypass(parts.hostname)
+
+    def _fetch_with_urllib(self, url: str, method: str, data):
+        request = Request(url, data=data, method=method)
+
+        for key, value in self.header_items():
+            if data is not None or key.lower() not in ("content-type", "content-length"):
+                request.add_header(key, value)
+
+        try:
+            response = urlopen(request, timeout=self.timeout)
+        except HTTPError as e:
+            if e.code == 304:
+                return e.code, e.headers, b""
+            raise
+
+        with response:
+            return response.status, response.headers, response.read()
+
+    async def _roundtrip(self, url: str, method: str, data):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+
+        while True:
+            connection = self.pool.get(key)
+            reused = connection is not None
+
+            if not reused:
+                connection = await self.pool.connect(key)
+
+            try:
+                status, reason, headers, body, keep_alive = await self._exchange(
+                    connection, parts, method, data
+                )
+
+            except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+                connection.close()
+
+                # The server may have closed an idle connection, so retry
+                # with a new one
+                if reused:
+                    continue
+                raise
+
+            except BaseException:
+                connection.close()
+                raise
+
+            break
+
+        if keep_alive:
+            self.pool.put(key, connection)
+        else:
+            connection.close()
+
+        if headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+
+        return status, reason, headers, body
+
+    async def _exchange(self, connection: AsyncConnection, parts, method: str, data):
+        connection.writer.write(self._serialize(parts, method, data))
+        await connection.writer.drain()
+
+        head = await connection.reader.readuntil(b"\r\n\r\n")
+        status_line, _, header_block = head.partition(b"\r\n")
+        version, status, *reason = status_line.decode("iso-8859-1").split(" ", 2)
+        status = int(status)
+        headers = parse_headers(BytesIO(header_block))
+
+        body, complete = await self._read_body(connection.reader, method, status, headers)
+
+        keep_alive = (
+            complete
+            and version == "HTTP/1.1"
+            and headers.get("Connection", "").lower() != "close"
+        )
+
+        return status, " ".join(reason).strip(), headers, body, keep_alive
+
+    def _serialize(self, parts, method: str, data) -> bytes:
+        selector = parts.path or "/"
+        if parts.query:
+            selector += f"?{parts.query}"
+
+        headers = {
+            "Host": parts.netloc,
+            "Accept-Encoding": "gzip",
+            "Connection": "keep-alive",
+        }
+        headers.update(
+            (key, value)
+            for key, value in self.header_items()
+            # The body is dropped when a redirect turns the request into a GET
+            if data is not None or key.lower() not in ("content-type", "content-length")
+        )
+
+        if data is not None:
+            headers["Content-Length"] = str(len(data))
+
+        lines = [f"{method} {selector} HTTP/1.1"]
+        lines += [f"{key}: {value}" for key, value in headers.items()]
+
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1") + (data or b"")
+
+    async def _read_body(self, reader, method: str, status, headers):
+        """Reads the response body.
+
+        Returns:
+            tuple: The body, and whether its end was determined by the
+                response itself (rather than by the server closing the
+                connection), i.e. whether the connection can be reused.
+        """
+        if method == "HEAD" or status in (204, 304) or status < 200:
+            return b"", True
+
+        if headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+
+            while True:
+                size_line = await reader.readline()
+                size = int(size_line.split(b";")[0].strip(), 16)
+
+                if size == 0:
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+
+            return b"".join(chunks), True
+
+        if "Content-Length" in headers:
+            return await reader.readexactly(int(headers["Content-Length"])), True
+
+        return await reader.read(), False
@@ -0,0 +1,306 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import asyncio
+import bisect
+import logging
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Metric:
+    """A metric family, with one value per combination of label values."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels: dict) -> Tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def samples(self):
+        """Yields (suffix, labels, value) for every sample of the family."""
+        with self.lock:
+            values = list(self.values.items())
+
+        for key, value in values:
+            yield "", dict(zip(self.labels, key)), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+        for suffix, labels, value in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{format_labels(labels)} {format_value(value)}"
+            )
+
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self.key(labels)
+
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that can go up and down.
+
+    If `function` is given, it is called whenever the metrics are collected
+    and returns the current value, or a dict mapping tuples of label values
+    to values.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        function: Optional[Callable] = None,
+    ):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def set(self, value: float, **labels) -> None:
+        key = self.key(labels)
+
+        with self.lock:
+            self.values[key] = value
+
+    def samples(self):
+        if self.function:
+            try:
+                values = self.function()
+            except Exception as e:
+                logging.error(f"Error collecting metric {self.name}: {e}")
+                return
+
+            if not isinstance(values, dict):
+                values = {(): values}
+
+            with self.lock:
+                self.values = dict(values)
+
+        yield from super().samples()
+
+
+class Histogram(Metric):
+    """Counts observations (e.g. durations in seconds) in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.key(labels)
+
+        with self.lock:
+            if (entry := self.values.get(key)) is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the time spent in the `with` block.
+
+        A "result" label, if the histogram has one, is set to "error" if the
+        block raises an exception, "cancelled" if it is cancelled (e.g. on a
+        timeout) and "ok" otherwise.
+        """
+        start = time.perf_counter()
+
+        try:
+            yield
+        except BaseException as e:
+            if "result" in self.labels:
+                labels["result"] = (
+                    "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+                )
+            raise
+        finally:
+            if "result" in self.labels:
+                labels.setdefault("result", "ok")
+
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            values = [
+                (key, (list(entry[0]), entry[1], entry[2]))
+                for key, entry in self.values.items()
+            ]
+
+        for key, (counts, total, count) in values:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", {**labels, "le": format_value(bound)}, cumulative
+
+            yield "_sum", labels, total
+            yield "_count", labels, count
+
+
+class Metrics:
+    """Collection of the metrics exposed in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Adds a metric, or returns the one already registered by that name."""
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        function: Optional[Callable] = None,
+    ) -> Gauge:
+        gauge = self.register(Gauge(name, help, labels, function))
+
+        if function:
+            gauge.function = function
+
+        return gauge
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+METRICS = Metrics()
+
+PROVIDER_REQUESTS = METRICS.histogram(
+    "trackbert_provider_request_seconds",
+    "Time spent querying a provider, by provider and result",
+    ["provider", "result"],
+)
+CYCLE_DURATION = METRICS.histogram(
+    "trackbert_cycle_seconds",
+    "Time spent checking all due shipments",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600),
+)
+CYCLE_SHIPMENTS = METRICS.counter(
+    "trackbert_shipments_checked_total", "Number of shipments checked"
+)
+SHIPMENT_TIMEOUTS = METRICS.counter(
+    "trackbert_shipment_timeouts_total",
+    "Number of shipments that were not checked in time, by provider",
+    ["provider"],
+)
+SHIPMENT_CHECKS = METRICS.counter(
+    "trackbert_shipment_checks_total",
+    "Number of shipment checks, by provider and outcome",
+    ["provider", "outcome"],
+)
+DB_WRITES = METRICS.histogram(
+    "trackbert_db_write_seconds",
+    "Time spent writing shipments, events and notifications, by result",
+    ["result"],
+)
+DB_WRITE_EVENTS = METRICS.counter(
+    "trackbert_events_written_total", "Number of new events written to the database"
+)
+NOTIFICATIONS = METRICS.histogram(
+    "trackbert_notification_seconds",
+    "Time spent sending a notification, by notifier and result",
+    ["notifier", "result"],
+)
+
+
+def start_metrics_server(port: int, address: str = "127.0.0.1", metrics: Metrics = METRICS):
+    """Serves the metrics at http://address:port/metrics in a background thread.
+
+    Returns:
+        ThreadingHTTPServer: The server, e.g. to shut it down.
+    """
+    # Only needed if metrics are enabled, so don't slow down every start
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+
+            body = metrics.render().encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"Metrics request: {format % args}")
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+
+    logging.info(f"Serving metrics at http://{address}:{server.server_port}/metrics")
+    return server
@@ -1,17 +1,191 @@
-from typing import Optional, Tuple, List, Generator
+from typing import Callable, Optional, Tuple, List, Dict, Generator
+from datetime import datetime, timezone
+
+import asyncio
+import logging
+import threading
 
 from ..classes.database import Event
+from ..classes.http import ResponseCache
+
+
+async def run_in_thread(function: Callable, *args):
+    """Runs a blocking function in a worker thread, like asyncio.to_thread().
+
+    A thread cannot be interrupted, so if the calling task is cancelled (e.g.
+    on a timeout), the task only finishes once the thread has finished, and
+    its result is discarded. Callers can thus tell from the task when the
+    work has actually stopped.
+    """
+    future = asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait({future})
+        raise
 
 
 class BaseProvider:
+    # Default rate limits, can be overridden in the provider's config section
+    requests_per_second: Optional[float] = None
+    burst: int = 1
+    daily_limit: Optional[int] = None
+
+    # Maximum number of tracking numbers get_status_many() accepts at once
+    batch_size: int = 1
+
+    # Carriers to use while the list from fetch_carriers() is not available
+    fallback_carriers: List[Tuple] = []
+
+    _response_cache: Optional[ResponseCache] = None
+
     def __init__(self, *args, **kwargs):
         pass
 
+    @property
+    def name(self) -> str:
+        return self.__class__.__name__
+
+    @property
+    def response_cache(self) -> ResponseCache:
+        """Cache of the last response for each shipment.
+
+        Providers use this to skip parsing responses that have not changed
+        since the last time the shipment was checked, and return no events
+        for them instead.
+        """
+        if self._response_cache is None:
+            self._response_cache = ResponseCache()
+
+        return self._response_cache
+
+    def commit_response(self, tracking_number: str, carrier: str) -> None:
+        """Remembers the last response for a shipment in the response cache.
+
+        Called once the shipment's events have been stored, see
+        ResponseCache.commit().
+        """
+        if self._response_cache is not None:
+            self._response_cache.commit(tracking_number, (carrier, tracking_number))
+
+    def forget_response(self, tracking_number: str, carrier: str) -> None:
+        """Removes a shipment from the response cache.
+
+        Called when the events returned for a shipment have been discarded,
+        e.g. because they arrived after the check's deadline. The next
+        response is then parsed even if it has not changed.
+        """
+        if self._response_cache is not None:
+            self._response_cache.discard(tracking_number, (carrier, tracking_number))
+
     def get_status(
         self, tracking_number: str, carrier: str
     ) -> Generator[Event, None, None]:
         raise NotImplementedError()
 
+    async def get_status_async(self, tracking_number: str, carrier: str) -> List[Event]:
+        """Asynchronously retrieves the events for a shipment.
+
+        Providers that can talk to their API without blocking should override
+        this. The default implementation runs get_status() in a worker thread
+        (see run_in_thread()), so synchronous providers keep working
+        unchanged.
+
+        Args:
+            tracking_number (str): The tracking number of the shipment.
+            carrier (str): The carrier code of the shipment.
+
+        Returns:
+            list: List of Event objects for the shipment.
+        """
+        return await run_in_thread(
+            lambda: list(self.get_status(tracking_number, carrier))
+        )
+
+    def get_status_many(
+        self, tracking_numbers: List[str], carrier: str
+    ) -> Dict[str, List[Event]]:
+        """Retrieves the events for several shipments of the same carrier.
+
+        Providers whose API accepts several tracking numbers per request
+        should override this and set batch_size accordingly. The default
+        implementation queries one tracking number at a time.
+
+        Args:
+            tracking_numbers (list): Up to batch_size tracking numbers.
+            carrier (str): The carrier code of the shipments.
+
+        Returns:
+            dict: Lists of Event objects, keyed by tracking number.
+        """
+        return {
+            tracking_number: list(self.get_status(tracking_number, carrier))
+            for tracking_number in tracking_numbers
+        }
+
+    async def get_status_many_async(
+        self, tracking_numbers: List[str], carrier: str
+    ) -> Dict[str, List[Event]]:
+        """Asynchronous version of get_status_many().
+
+        The default implementation runs get_status_many() in a worker thread
+        if the provider overrides it, and queries the tracking numbers
+        concurrently using get_status_async() otherwise.
+        """
+        if type(self).get_status_many is not BaseProvider.get_status_many:
+            return await run_in_thread(self.get_status_many, tracking_numbers, carrier)
+
+        results = await asyncio.gather(
+            *[
+                self.get_status_async(tracking_number, carrier)
+                for tracking_number in tracking_numbers
+            ]
+        )
+
+        return dict(zip(tracking_numbers, results))
+
+    @staticmethod
+    def normalize_time(value: str | datetime, format: Optional[str] = None) -> datetime:
+        """Converts a timestamp returned by an API to a naive UTC datetime.
+
+        Timestamps without time zone information are assumed to be in local
+        time.
+
+        Args:
+            value (str | datetime): The timestamp to convert.
+            format (str, optional): strptime format of the timestamp. If not
+                given, the format is detected automatically.
+
+        Returns:
+            datetime: The timestamp in UTC, without tzinfo.
+        """
+        if not isinstance(value, datetime):
+            if format:
+                value = datetime.strptime(value, format)
+            else:
+                from dateutil.parser import parse
+
+                value = parse(value)
+
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    def fetch_carriers(self) -> List[Tuple[str, int, Optional[str]]]:
+        """Retrieves the supported carriers from the provider's API.
+
+        Providers that need a network request to find out which carriers they
+        support should override this instead of doing the request in
+        supported_carriers(). The result is cached on disk by the Core, and
+        fallback_carriers are used until it is available.
+
+        Returns:
+            list: List of supported carriers, like supported_carriers().
+
+        Raises:
+            Exception: If the carriers could not be retrieved.
+        """
+        raise NotImplementedError()
+
     def supported_carriers(self) -> List[Tuple[str, int, Optional[str]]]:
         """Defines the carriers supported by this tracker.
 
@@ -25,3 +199,47 @@ class BaseProvider:
             NotImplementedError: When this method is not implemented by the subclass.
         """
         raise NotImplementedError()
+
+
+class LazyProvider:
+    """Stands in for a provider until it is actually used.
+
+    The provider class is only loaded (i.e. its module and API library are
+    only imported) and instantiated when one of its attributes is accessed
+    for the first time, which happens when a shipment of one of its carriers
+    is checked.
+
+    Args:
+        loader (Callable): Returns the provider class.
+        name (str): The name of the provider class.
+        **kwargs: Arguments to instantiate the provider with.
+    """
+
+    def __init__(self, loader: Callable, name: str, **kwargs):
+        self.loader = loader
+        self.name = name
+        self.kwargs = kwargs
+
+        self._provider = None
+        self._lock = threading.Lock()
+
+    @property
+    def provider(self) -> BaseProvider:
+        if self._provider is None:
+            with self._lock:
+                if self._provider is None:
+                    logging.debug(f"Loading provider {self.name}")
+                    self._provider = self.loader()(**self.kwargs)
+
+        return self._provider
+
+    def load(self) -> BaseProvider:
+        """Loads the provider if it is not loaded yet.
+
+        Raises:
+            Exception: Whatever loading or instantiating the provider raised.
+        """
+        return self.provider
+
+    def __getattr__(self, attr):
+        return getattr(self.provider, attr)
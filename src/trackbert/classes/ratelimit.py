@@ -0,0 +1,141 @@
+from configparser import ConfigParser
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import threading
+import time
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Rate limit for {provider} reached")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Token bucket limiting the number of requests sent to a provider.
+
+    Tokens are refilled continuously at `requests_per_second`, up to `burst`
+    tokens. Additionally, at most `daily_limit` requests are allowed per UTC
+    day. Both limits are optional.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: Optional[float] = None,
+        burst: int = 1,
+        daily_limit: Optional[int] = None,
+    ):
+        self.requests_per_second = requests_per_second
+        self.burst = max(burst, 1)
+        self.daily_limit = daily_limit
+
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+        self.day = self._today()
+        self.daily_count = 0
+
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(
+        cls,
+        config: ConfigParser,
+        section: str,
+        requests_per_second: Optional[float] = None,
+        burst: int = 1,
+        daily_limit: Optional[int] = None,
+    ) -> Optional["RateLimiter"]:
+        """Creates a RateLimiter from a config section.
+
+        Args:
+            config (ConfigParser): The configuration to read.
+            section (str): The section to read the limits from, usually the
+                name of the provider class.
+            requests_per_second (float, optional): Default rate if not configured.
+            burst (int, optional): Default burst size if not configured.
+            daily_limit (int, optional): Default daily cap if not configured.
+
+        Returns:
+            RateLimiter: The rate limiter, or None if no limits are configured.
+        """
+        if config and config.has_section(section):
+            requests_per_second = config.getfloat(
+                section, "requests_per_second", fallback=requests_per_second
+            )
+            burst = config.getint(section, "burst", fallback=burst)
+            daily_limit = config.getint(section, "daily_limit", fallback=daily_limit)
+
+        if not (requests_per_second or daily_limit):
+            return None
+
+        return cls(requests_per_second or None, burst, daily_limit or None)
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date()
+
+    def _refill(self):
+        now = time.monotonic()
+
+        if self.requests_per_second:
+            self.tokens = min(
+                self.burst,
+                self.tokens + (now - self.updated) * self.requests_per_second,
+            )
+
+        self.updated = now
+
+        if (today := self._today()) != self.day:
+            self.day = today
+            self.daily_count = 0
+
+    def reserve(self, max_wait: float = 0) -> Optional[float]:
+        """Reserves a request.
+
+        Args:
+            max_wait (float, optional): The maximum number of seconds the caller
+                is willing to wait for the request to be allowed.
+
+        Returns:
+            float: Number of seconds the caller has to wait before sending the
+                request, or None if the request cannot be sent within max_wait
+                and should be deferred.
+        """
+        with self.lock:
+            self._refill()
+
+            if self.daily_limit and self.daily_count >= self.daily_limit:
+                return None
+
+            wait = 0.0
+
+            if self.requests_per_second:
+                if self.tokens < 1:
+                    wait = (1 - self.tokens) / self.requests_per_second
+
+                if wait > max_wait:
+                    return None
+
+                self.tokens -= 1
+
+            self.daily_count += 1
+            return wait
+
+    def retry_after(self) -> float:
+        """Returns the number of seconds until a request can be sent again."""
+        with self.lock:
+            self._refill()
+
+            if self.daily_limit and self.daily_count >= self.daily_limit:
+                tomorrow = datetime.combine(
+                    self.day + timedelta(days=1), datetime.min.time(), timezone.utc
+                )
+                return (tomorrow - datetime.now(timezone.utc)).total_seconds()
+
+            if self.requests_per_second and self.tokens < 1:
+                return (1 - self.tokens) / self.requests_per_second
+
+            return 0.0
@@ -0,0 +1,63 @@
+from typing import Dict, List, Optional, Tuple
+
+from .provider import BaseProvider
+
+
+class ProviderRegistry:
+    """Maps carrier codes to the providers supporting them.
+
+    Built once from the (carrier, priority, provider, name) tuples collected
+    at startup. Each carrier's providers are kept ordered by priority, so the
+    best provider for a carrier is found with a single dictionary lookup.
+    Providers registered for the wildcard carrier "*" are used for carriers
+    without a provider of higher priority.
+
+    Among providers with the same priority, the one registered first wins.
+    """
+
+    WILDCARD = "*"
+
+    def __init__(self, providers: list = ()):
+        self.carriers: Dict[str, List[tuple]] = {}
+
+        for index, entry in enumerate(providers):
+            carrier, priority, provider = entry[:3]
+            name = entry[3] if len(entry) > 3 else None
+
+            self.carriers.setdefault(carrier, []).append(
+                (-priority, index, provider, name)
+            )
+
+        for entries in self.carriers.values():
+            entries.sort(key=lambda x: x[:2])
+
+        self.wildcard = self.carriers.get(self.WILDCARD, [])
+
+    def get(self, carrier: str) -> Optional[BaseProvider]:
+        """Returns the provider with the highest priority for a carrier.
+
+        Args:
+            carrier (str): The carrier code.
+
+        Returns:
+            BaseProvider: The provider, or None if neither the carrier nor
+                the wildcard is supported.
+        """
+        candidates = [
+            entries[0]
+            for entries in (self.carriers.get(carrier), self.wildcard)
+            if entries
+        ]
+
+        if candidates:
+            return min(candidates, key=lambda x: x[:2])[2]
+
+    def list_carriers(self) -> List[Tuple[str, Optional[str]]]:
+        """Returns the code and name of every supported carrier, sorted by code.
+
+        The name is taken from the provider with the highest priority for the
+        carrier.
+        """
+        return sorted(
+            (carrier, entries[0][3]) for carrier, entries in self.carriers.items()
+        )
@@ -0,0 +1,101 @@
+from configparser import ConfigParser
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import random
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class Scheduler:
+    """Decides when each shipment is polled next.
+
+    Shipments are polled every `min_interval` seconds while new events keep
+    coming in. Every poll without new events multiplies the interval by
+    `backoff`, up to `max_interval`. A random `jitter` (fraction of the
+    interval) is applied so that shipments added together drift apart.
+
+    The time of the next poll is stored on the shipment (next_poll_at), and
+    due shipments are claimed from the database in that order (see
+    Database.claim_shipments()).
+    """
+
+    def __init__(
+        self,
+        min_interval: int = 60,
+        max_interval: int = 21600,
+        backoff: float = 2.0,
+        jitter: float = 0.1,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.backoff = backoff
+        self.jitter = jitter
+
+    @classmethod
+    def from_config(cls, config: ConfigParser, min_interval: int = 60) -> "Scheduler":
+        min_interval = config.getint("Trackbert", "min_interval", fallback=min_interval)
+
+        return cls(
+            min_interval,
+            config.getint("Trackbert", "max_interval", fallback=21600),
+            config.getfloat("Trackbert", "backoff", fallback=2.0),
+            config.getfloat("Trackbert", "jitter", fallback=0.1),
+        )
+
+    def schedule(
+        self,
+        shipment,
+        changed: bool,
+        now: Optional[datetime] = None,
+    ) -> datetime:
+        """Computes the next poll of a shipment.
+
+        Args:
+            shipment (Shipment): The shipment that has just been polled.
+            changed (bool): Whether the poll returned new events.
+            now (datetime, optional): Current time (UTC).
+
+        Returns:
+            datetime: The time of the next poll (UTC). The shipment's
+                next_poll_at and poll_interval are updated as well.
+        """
+        now = now or utcnow()
+
+        if changed or not shipment.poll_interval:
+            interval = self.min_interval
+        else:
+            interval = min(shipment.poll_interval * self.backoff, self.max_interval)
+
+        wait = interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        shipment.poll_interval = int(interval)
+        shipment.next_poll_at = now + timedelta(seconds=wait)
+
+        return shipment.next_poll_at
+
+    def defer(self, shipment, delay: float, now: Optional[datetime] = None) -> datetime:
+        """Postpones the poll of a shipment that could not be polled yet.
+
+        Used when the provider is rate limited. As the shipment has not been
+        polled, its interval (and thus the backoff) is left unchanged.
+
+        Args:
+            shipment (Shipment): The shipment to postpone.
+            delay (float): Number of seconds until the shipment may be polled.
+            now (datetime, optional): Current time (UTC).
+
+        Returns:
+            datetime: The time of the next poll (UTC), which is also stored in
+                the shipment's next_poll_at.
+        """
+        now = now or utcnow()
+
+        # Spread the deferred shipments out a little, like the polls
+        wait = delay * random.uniform(1, 1 + self.jitter)
+
+        shipment.next_poll_at = now + timedelta(seconds=wait)
+
+        return shipment.next_poll_at
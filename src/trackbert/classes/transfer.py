@@ -0,0 +1,125 @@
+from typing import Dict, Generator, Iterable, Optional, TextIO
+from datetime import timezone
+from itertools import groupby
+
+import csv
+import json
+
+SHIPMENT_FIELDS = ["tracking_number", "carrier", "description", "disabled"]
+EVENT_FIELDS = ["event_time", "event_description"]
+
+FORMATS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+}
+
+
+def guess_format(filename: Optional[str], default: str = "csv") -> str:
+    """Guesses the format of a file from its extension."""
+    if filename:
+        for extension, format in FORMATS.items():
+            if filename.lower().endswith(extension):
+                return format
+
+    return default
+
+
+def parse_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+
+    return bool(value)
+
+
+def read_shipments(stream: TextIO, format: str) -> Generator[Dict, None, None]:
+    """Reads shipments from a CSV or NDJSON file, one at a time.
+
+    Only the known shipment fields are returned, and only if they are present
+    in the input, so that missing fields are not overwritten when updating
+    existing shipments.
+
+    Raises:
+        ValueError: If a line is invalid or has no tracking number.
+    """
+    if format == "csv":
+        rows = csv.DictReader(stream)
+    else:
+        rows = (json.loads(line) for line in stream if line.strip())
+
+    for number, row in enumerate(rows, 1):
+        shipment = {
+            field: row[field]
+            for field in SHIPMENT_FIELDS
+            if field in row and row[field] is not None
+        }
+
+        if not shipment.get("tracking_number"):
+            raise ValueError(f"Entry {number} has no tracking number")
+
+        if "disabled" in shipment:
+            shipment["disabled"] = parse_bool(shipment["disabled"])
+
+        yield shipment
+
+
+def export_rows(results: Iterable, with_events: bool = False, format: str = "csv"):
+    """Turns rows of shipments (joined with their events) into export records.
+
+    Args:
+        results (Iterable): Rows with the shipment fields (and the event
+            fields if `with_events` is set), ordered by shipment.
+        with_events (bool): Whether the rows contain events.
+        format (str): "csv" for one record per event (or shipment without
+            events), "ndjson" for one record per shipment with a list of
+            events.
+    """
+    if not with_events:
+        for row in results:
+            yield {field: getattr(row, field) for field in SHIPMENT_FIELDS}
+        return
+
+    for _, rows in groupby(results, key=lambda row: row.id):
+        rows = list(rows)
+        shipment = {field: getattr(rows[0], field) for field in SHIPMENT_FIELDS}
+
+        events = [
+            {
+                "event_time": row.event_time.replace(tzinfo=timezone.utc).isoformat(),
+                "event_description": row.event_description,
+            }
+            for row in rows
+            if row.event_time is not None
+        ]
+
+        if format == "ndjson":
+            yield {**shipment, "events": events}
+            continue
+
+        for event in events or [dict.fromkeys(EVENT_FIELDS, "")]:
+            yield {**shipment, **event}
+
+
+def write_shipments(stream: TextIO, records: Iterable[Dict], format: str, with_events: bool = False) -> int:
+    """Writes export records to a file as they come in.
+
+    Returns:
+        int: The number of records written.
+    """
+    count = 0
+
+    if format == "csv":
+        fields = SHIPMENT_FIELDS + (EVENT_FIELDS if with_events else [])
+        writer = csv.DictWriter(stream, fields)
+        writer.writeheader()
+
+        for record in records:
+            writer.writerow(record)
+            count += 1
+
+    else:
+        for record in records:
+            stream.write(json.dumps(record) + "\n")
+            count += 1
+
+    return count
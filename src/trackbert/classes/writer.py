@@ -0,0 +1,178 @@
+from typing import Callable, Optional
+
+import logging
+import threading
+import time
+
+import sqlalchemy.exc
+
+from .database import Database
+from .metrics import DB_WRITES, DB_WRITE_EVENTS
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether writing may succeed if it is simply tried again later."""
+    return isinstance(
+        error, (sqlalchemy.exc.OperationalError, sqlalchemy.exc.TimeoutError)
+    ) or getattr(error, "connection_invalidated", False)
+
+
+class EventWriter:
+    """Buffers shipment updates and new events and writes them in batches.
+
+    Everything added during a cycle is written in a single transaction when
+    flush() is called at the end of the cycle, or earlier once `max_events`
+    events are pending or the oldest pending update is older than `max_delay`
+    seconds.
+
+    If `outbox` is given, it is called with every shipment that has new
+    events, along with those events, and returns rows to add to the
+    notification outbox in the same transaction.
+
+    After a successful flush, `on_flush` is called with every shipment that
+    had new events, along with those events, and `on_write` with the list of
+    all shipments that have been written.
+
+    If `worker_id` is given, the leases this worker holds on the written
+    shipments are released in the same transaction.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        on_flush: Optional[Callable] = None,
+        max_events: int = 500,
+        max_delay: float = 5.0,
+        outbox: Optional[Callable] = None,
+        worker_id: Optional[str] = None,
+        on_write: Optional[Callable] = None,
+    ):
+        self.db = db
+        self.on_flush = on_flush
+        self.max_events = max_events
+        self.max_delay = max_delay
+        self.outbox = outbox
+        self.worker_id = worker_id
+        self.on_write = on_write
+
+        self.shipments = {}
+        self.events = {}
+        self.pending_events = 0
+        self.pending_since = None
+
+        self.lock = threading.RLock()
+
+    def add(self, shipment, new_events: list) -> None:
+        with self.lock:
+            self.shipments[shipment.id] = shipment
+
+            if new_events:
+                self.events.setdefault(shipment.id, []).extend(new_events)
+                self.pending_events += len(new_events)
+
+            if self.pending_since is None:
+                self.pending_since = time.monotonic()
+
+            if (
+                self.pending_events >= self.max_events
+                or time.monotonic() - self.pending_since >= self.max_delay
+            ):
+                self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.shipments:
+                return
+
+            shipments, self.shipments = self.shipments, {}
+            events, self.events = self.events, {}
+
+            try:
+                self.write(shipments, events)
+
+            except Exception as e:
+                if is_transient(e):
+                    self.restore(shipments, events)
+                    raise
+
+                # Don't let a single bad row block all writes: write the
+                # shipments one by one and drop the ones that still fail
+                logging.warning(
+                    f"Error writing {len(shipments)} shipments, retrying one by one: {e}"
+                )
+                self.write_separately(shipments, events)
+
+            written_events = sum(len(batch) for batch in events.values())
+
+            logging.debug(f"Wrote {len(shipments)} shipments and {written_events} events")
+
+            DB_WRITE_EVENTS.inc(written_events)
+
+            self.pending_events = sum(len(batch) for batch in self.events.values())
+            self.pending_since = time.monotonic() if self.shipments else None
+
+        if self.on_write:
+            self.on_write(list(shipments.values()))
+
+        if self.on_flush:
+            for shipment_id, batch in events.items():
+                self.on_flush(shipments[shipment_id], batch)
+
+    def write(self, shipments: dict, events: dict) -> None:
+        notifications = []
+        if self.outbox:
+            for shipment_id, batch in events.items():
+                notifications += self.outbox(shipments[shipment_id], batch)
+
+        with DB_WRITES.time():
+            self.db.save_shipments(
+                list(shipments.values()),
+                [event for batch in events.values() for event in batch],
+                notifications,
+                self.worker_id,
+            )
+
+    def write_separately(self, shipments: dict, events: dict) -> None:
+        """Writes each shipment in its own transaction.
+
+        Shipments that cannot be written are removed from `shipments` and
+        `events` and logged. On a transient error, the shipments that have
+        not been written yet are kept for the next flush and the error is
+        raised.
+        """
+        shipment_ids = list(shipments)
+
+        for index, shipment_id in enumerate(shipment_ids):
+            shipment = shipments[shipment_id]
+            batch = {shipment_id: events[shipment_id]} if shipment_id in events else {}
+
+            try:
+                self.write({shipment_id: shipment}, batch)
+
+            except Exception as e:
+                if is_transient(e):
+                    remaining = shipment_ids[index:]
+                    self.restore(
+                        {key: shipments[key] for key in remaining},
+                        {key: events[key] for key in remaining if key in events},
+                    )
+                    raise
+
+                logging.error(
+                    f"Dropping update of {shipment.tracking_number} "
+                    f"with {len(batch.get(shipment_id, []))} new events: {e}",
+                    exc_info=e,
+                )
+
+                del shipments[shipment_id]
+                events.pop(shipment_id, None)
+
+    def restore(self, shipments: dict, events: dict) -> None:
+        """Keeps updates that could not be written for the next attempt."""
+        # Without overwriting anything that has been added in the meantime
+        for shipment_id, shipment in shipments.items():
+            self.shipments.setdefault(shipment_id, shipment)
+        for shipment_id, batch in events.items():
+            self.events[shipment_id] = batch + self.events.get(shipment_id, [])
+
+        self.pending_events = sum(len(batch) for batch in self.events.values())
@@ -0,0 +1,28 @@
+"""Shipment leases
+
+Revision ID: 0b0f8ec56f76
+Revises: fd7c646306b2
+Create Date: 2026-10-17 14:02:47.318264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b0f8ec56f76'
+down_revision: Union[str, None] = 'fd7c646306b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('shipments', sa.Column('worker_id', sa.String(), nullable=True))
+    op.add_column('shipments', sa.Column('leased_until', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('shipments', 'leased_until')
+    op.drop_column('shipments', 'worker_id')
@@ -0,0 +1,53 @@
+"""Event and shipment indexes
+
+Revision ID: 2b1b81f53d43
+Revises: bdd5b27c62ea
+Create Date: 2026-10-17 10:03:47.881520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+import logging
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b1b81f53d43'
+down_revision: Union[str, None] = 'bdd5b27c62ea'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_events_shipment_id_event_time', 'events', ['shipment_id', 'event_time']
+    )
+
+    # Older versions did not prevent adding the same tracking number twice,
+    # so only enforce uniqueness if the existing data allows it
+    duplicates = op.get_bind().execute(
+        sa.text(
+            "SELECT tracking_number FROM shipments "
+            "GROUP BY tracking_number HAVING COUNT(*) > 1"
+        )
+    ).fetchall()
+
+    if duplicates:
+        logging.warning(
+            "Not making shipments.tracking_number unique, duplicate tracking numbers: "
+            + ", ".join(str(row[0]) for row in duplicates)
+        )
+
+    op.create_index(
+        'ix_shipments_tracking_number',
+        'shipments',
+        ['tracking_number'],
+        unique=not duplicates,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_shipments_tracking_number', table_name='shipments')
+    op.drop_index('ix_events_shipment_id_event_time', table_name='events')
@@ -0,0 +1,65 @@
+"""Store raw events compressed in a separate table
+
+Revision ID: 8bafb7b0356e
+Revises: 64a75e106b2b
+Create Date: 2026-10-17 17:21:53.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+import sqlalchemy as sa
+import zlib
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8bafb7b0356e'
+down_revision: Union[str, None] = '64a75e106b2b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def copy(query, statement, function):
+    bind = op.get_bind()
+
+    # Copy in batches rather than loading every row into memory at once
+    rows = bind.execute(query).fetchmany
+    while batch := rows(10000):
+        bind.execute(
+            statement,
+            [{"id": row[0], "value": function(row[1])} for row in batch],
+        )
+
+
+def upgrade() -> None:
+    op.create_table(
+        'event_payloads',
+        sa.Column('event_id', sa.Integer(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(['event_id'], ['events.id']),
+        sa.PrimaryKeyConstraint('event_id'),
+    )
+
+    copy(
+        sa.text("SELECT id, raw_event FROM events WHERE raw_event IS NOT NULL"),
+        sa.text(
+            "INSERT INTO event_payloads (event_id, data) VALUES (:id, :value)"
+        ).bindparams(sa.bindparam("value", type_=sa.LargeBinary())),
+        lambda value: zlib.compress(value.encode("utf-8")),
+    )
+
+    with op.batch_alter_table('events') as batch_op:
+        batch_op.drop_column('raw_event')
+
+
+def downgrade() -> None:
+    op.add_column('events', sa.Column('raw_event', sa.String(), nullable=True))
+
+    copy(
+        sa.text("SELECT event_id, data FROM event_payloads"),
+        sa.text("UPDATE events SET raw_event = :value WHERE id = :id"),
+        lambda value: zlib.decompress(value).decode("utf-8"),
+    )
+
+    op.drop_table('event_payloads')
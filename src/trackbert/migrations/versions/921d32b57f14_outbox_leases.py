@@ -0,0 +1,28 @@
+"""Outbox leases
+
+Revision ID: 921d32b57f14
+Revises: 0b0f8ec56f76
+Create Date: 2026-10-17 16:41:09.852130
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '921d32b57f14'
+down_revision: Union[str, None] = '0b0f8ec56f76'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('outbox', sa.Column('claimed_by', sa.String(), nullable=True))
+    op.add_column('outbox', sa.Column('claimed_until', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('outbox', 'claimed_until')
+    op.drop_column('outbox', 'claimed_by')
@@ -0,0 +1,30 @@
+"""Shipment.next_poll_at
+
+Revision ID: bdd5b27c62ea
+Revises: 91ca1665ca83
+Create Date: 2026-10-17 09:12:31.504117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bdd5b27c62ea'
+down_revision: Union[str, None] = '91ca1665ca83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('shipments', sa.Column('next_poll_at', sa.DateTime(), nullable=True))
+    op.add_column('shipments', sa.Column('poll_interval', sa.Integer(), nullable=True))
+    op.create_index('ix_shipments_next_poll_at', 'shipments', ['next_poll_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_shipments_next_poll_at', table_name='shipments')
+    op.drop_column('shipments', 'poll_interval')
+    op.drop_column('shipments', 'next_poll_at')
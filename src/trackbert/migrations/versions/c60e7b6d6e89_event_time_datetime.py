@@ -0,0 +1,113 @@
+"""Store event times as UTC DateTime
+
+Revision ID: c60e7b6d6e89
+Revises: fa3565720814
+Create Date: 2026-10-17 12:40:18.662403
+
+"""
+from typing import Sequence, Union
+from datetime import timezone
+
+from alembic import op
+from dateutil.parser import parse
+
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c60e7b6d6e89'
+down_revision: Union[str, None] = 'fa3565720814'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def to_utc(value):
+    # Timestamps were stored as strings in the carrier's format, without time
+    # zone, so treat them as local time like the providers now do
+    if not value:
+        return None
+
+    try:
+        return parse(value).astimezone(timezone.utc).replace(tzinfo=None)
+    except (ValueError, OverflowError):
+        return None
+
+
+def to_local_string(value):
+    if not value:
+        return None
+
+    return value.replace(tzinfo=timezone.utc).astimezone().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def convert(table, source, target, function, source_type, target_type, batch_size=10000):
+    bind = op.get_bind()
+
+    id_column = sa.column('id')
+    query = (
+        sa.select(id_column, sa.column(source, source_type))
+        .select_from(sa.table(table))
+        .order_by(id_column)
+        .limit(batch_size)
+    )
+
+    statement = sa.text(
+        f"UPDATE {table} SET {target} = :value WHERE id = :id"
+    ).bindparams(sa.bindparam("value", type_=target_type))
+
+    # Convert in batches rather than loading every row into memory at once
+    last_id = None
+    while rows := bind.execute(
+        query if last_id is None else query.where(id_column > last_id)
+    ).fetchall():
+        bind.execute(
+            statement, [{"id": row[0], "value": function(row[1])} for row in rows]
+        )
+        last_id = rows[-1][0]
+
+
+def replace_column(table, column, type_):
+    with op.batch_alter_table(table) as batch_op:
+        batch_op.drop_column(column)
+        batch_op.alter_column(
+            f"{column}_new", new_column_name=column, existing_type=type_
+        )
+
+
+def upgrade() -> None:
+    op.drop_index('ix_events_shipment_id_event_time', table_name='events')
+
+    op.add_column('events', sa.Column('event_time_new', sa.DateTime(), nullable=True))
+    op.add_column('shipments', sa.Column('last_event_time_new', sa.DateTime(), nullable=True))
+
+    for table, column in (('events', 'event_time'), ('shipments', 'last_event_time')):
+        convert(table, column, f"{column}_new", to_utc, sa.String(), sa.DateTime())
+
+    replace_column('events', 'event_time', sa.DateTime())
+    replace_column('shipments', 'last_event_time', sa.DateTime())
+
+    # Hashes were computed from the old string representation
+    op.execute("UPDATE shipments SET last_event_hash = NULL")
+
+    op.create_index(
+        'ix_events_shipment_id_event_time', 'events', ['shipment_id', 'event_time']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_events_shipment_id_event_time', table_name='events')
+
+    op.add_column('events', sa.Column('event_time_new', sa.String(), nullable=True))
+    op.add_column('shipments', sa.Column('last_event_time_new', sa.String(), nullable=True))
+
+    for table, column in (('events', 'event_time'), ('shipments', 'last_event_time')):
+        convert(
+            table, column, f"{column}_new", to_local_string, sa.DateTime(), sa.String()
+        )
+
+    replace_column('events', 'event_time', sa.String())
+    replace_column('shipments', 'last_event_time', sa.String())
+
+    op.create_index(
+        'ix_events_shipment_id_event_time', 'events', ['shipment_id', 'event_time']
+    )
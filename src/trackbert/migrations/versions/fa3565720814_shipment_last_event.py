@@ -0,0 +1,34 @@
+"""Shipment.last_event_time and Shipment.last_event_hash
+
+Revision ID: fa3565720814
+Revises: 2b1b81f53d43
+Create Date: 2026-10-17 11:27:05.310942
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fa3565720814'
+down_revision: Union[str, None] = '2b1b81f53d43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('shipments', sa.Column('last_event_time', sa.String(), nullable=True))
+    op.add_column('shipments', sa.Column('last_event_hash', sa.String(), nullable=True))
+
+    # The hash is filled in with the next new event of each shipment
+    op.execute(
+        "UPDATE shipments SET last_event_time = "
+        "(SELECT MAX(event_time) FROM events WHERE events.shipment_id = shipments.id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('shipments', 'last_event_hash')
+    op.drop_column('shipments', 'last_event_time')
@@ -0,0 +1,62 @@
+"""Archive tables
+
+Revision ID: fd7c646306b2
+Revises: 8bafb7b0356e
+Create Date: 2026-10-17 18:05:12.734519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fd7c646306b2'
+down_revision: Union[str, None] = '8bafb7b0356e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'archived_shipments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('shipment_id', sa.Integer(), nullable=True),
+        sa.Column('tracking_number', sa.String(), nullable=True),
+        sa.Column('carrier', sa.String(), nullable=True),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('disabled', sa.Boolean(), nullable=True),
+        sa.Column('last_event_time', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_archived_shipments_tracking_number',
+        'archived_shipments',
+        ['tracking_number'],
+    )
+    op.create_table(
+        'archived_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('shipment_id', sa.Integer(), nullable=True),
+        sa.Column('event_time', sa.DateTime(), nullable=True),
+        sa.Column('event_description', sa.String(), nullable=True),
+        sa.Column('data', sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(['shipment_id'], ['archived_shipments.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_archived_events_shipment_id',
+        'archived_events',
+        ['shipment_id'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_archived_events_shipment_id', table_name='archived_events')
+    op.drop_table('archived_events')
+    op.drop_index(
+        'ix_archived_shipments_tracking_number', table_name='archived_shipments'
+    )
+    op.drop_table('archived_shipments')
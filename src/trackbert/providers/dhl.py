@@ -2,12 +2,10 @@ from ..classes.provider import BaseProvider
 from ..classes.database import Event
 
 from dhltrack import DHL as DHLAPI
-from dateutil.parser import parse
 
-import json
 import logging
 
-from datetime import datetime
+from urllib.parse import urlencode
 from configparser import ConfigParser
 
 
@@ -18,20 +16,45 @@ class DHL(BaseProvider):
         config = ConfigParser()
         config.read(kwargs.get("config"))
 
-        self.ratelimited = config.getboolean("dhl", "ratelimited", fallback=True)
+        self.ratelimited = config.getboolean("DHL", "ratelimited", fallback=True)
 
-    def get_status(self, tracking_number, carrier):
+        # Spread the default quota of 250 requests per day evenly over the day
         if self.ratelimited:
-            if datetime.now().minute != 0:
-                logging.warn("Skipping DHL API call due to ratelimiting")
-                return
+            self.daily_limit = 250
+            self.requests_per_second = 250 / 86400
 
+    def get_status(self, tracking_number, carrier):
         try:
-            response = self.api.track(tracking_number)
+            response = self.response_cache.execute(
+                tracking_number, self.get_track_request(tracking_number)
+            )
         except Exception as e:
             logging.error(f"Error getting events for {tracking_number}: {e}")
             return
 
+        yield from self.parse_response(tracking_number, response)
+
+    async def get_status_async(self, tracking_number, carrier):
+        try:
+            response = await self.response_cache.execute_async(
+                tracking_number, self.get_track_request(tracking_number)
+            )
+        except Exception as e:
+            logging.error(f"Error getting events for {tracking_number}: {e}")
+            return []
+
+        return list(self.parse_response(tracking_number, response))
+
+    def get_track_request(self, tracking_number):
+        return self.api.get_request(
+            f"shipments?{urlencode({'trackingNumber': tracking_number})}"
+        )
+
+    def parse_response(self, tracking_number, response):
+        if response is None:
+            logging.debug(f"No changes for {tracking_number}")
+            return
+
         try:
             all_events = response["shipments"][0]["events"]
             logging.debug(f"Got events for {tracking_number}: {len(all_events)}")
@@ -43,7 +66,7 @@ class DHL(BaseProvider):
         events = sorted(all_events, key=lambda x: x["timestamp"], reverse=True)
 
         for event in events:
-            event_time = parse(event["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+            event_time = self.normalize_time(event["timestamp"])
 
             try:
                 event_locality = f"[{event['location']['address']['addressLocality']}] "
@@ -56,7 +79,7 @@ class DHL(BaseProvider):
                 shipment_id=0,
                 event_time=event_time,
                 event_description=event_description,
-                raw_event=json.dumps(event),
+                raw_event=event,
             )
 
     def supported_carriers(self):
@@ -2,19 +2,24 @@ from ..classes.provider import BaseProvider
 from ..classes.database import Event
 
 import json
-
-from datetime import datetime
+import logging
 
 from dpdtrack.classes.api import DPD as DPDAPI
 
 
 class DPD(BaseProvider):
     def __init__(self, *args, **kwargs):
-        pass
+        self.api = DPDAPI()
 
     def get_status(self, tracking_number, carrier):
-        api = DPDAPI()
-        status = api.tracking(tracking_number)
+        status = self.api.tracking(tracking_number)
+
+        # The API client only returns the decoded response
+        if not self.response_cache.store(
+            tracking_number, json.dumps(status, sort_keys=True).encode()
+        ):
+            logging.debug(f"No changes for {tracking_number}")
+            return
 
         events = status["data"][0]["lifecycle"]["entries"]
 
@@ -24,14 +29,13 @@ class DPD(BaseProvider):
             else:
                 event_location = ""
 
-            event_timestamp = datetime.strptime(event["datetime"], "%Y%m%d%H%M%S")
-            event_time = event_timestamp.strftime("%Y-%m-%d %H:%M:%S")
+            event_time = self.normalize_time(event["datetime"], "%Y%m%d%H%M%S")
 
             yield Event(
                 shipment_id=0,
                 event_time=event_time,
                 event_description=f"{event_location}{event['state']['text']}",
-                raw_event=json.dumps(event),
+                raw_event=event,
             )
 
     def supported_carriers(self):
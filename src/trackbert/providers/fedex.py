@@ -1,46 +1,156 @@
 from ..classes.provider import BaseProvider
 from ..classes.database import Event
+from ..classes.http import AsyncHTTPRequest
 
 from fedextrack import FedEx as FedExAPI
-from dateutil.parser import parse
 
 import json
 import logging
+import time
+
+from urllib.parse import urlencode
 
 
 class FedEx(BaseProvider):
+    # The track API accepts up to 30 tracking numbers per request
+    batch_size = 30
+
     def __init__(self, *args, **kwargs):
         self.api = FedExAPI.from_config(str(kwargs.get("config")))
 
+        self._token = None
+        self._token_expiry = 0
+
     def get_status(self, tracking_number, carrier):
-        response = self.api.track_by_tracking_number(tracking_number)
+        yield from self.get_status_many([tracking_number], carrier)[tracking_number]
+
+    def get_status_many(self, tracking_numbers, carrier):
+        request = self.get_track_request(tracking_numbers)
+        request.add_header("Authorization", "Bearer " + self.get_token())
+
+        return self.parse_response(tracking_numbers, request.execute())
+
+    async def get_status_async(self, tracking_number, carrier):
+        results = await self.get_status_many_async([tracking_number], carrier)
+        return results[tracking_number]
+
+    async def get_status_many_async(self, tracking_numbers, carrier):
+        request = self.get_track_request(tracking_numbers)
+        request.add_header("Authorization", "Bearer " + await self.get_token_async())
+
+        response = await AsyncHTTPRequest.from_request(request).execute()
+        return self.parse_response(tracking_numbers, response)
+
+    def get_token_request(self):
+        request = self.api.get_request(self.api.OAUTH_TOKEN, {}, False)
+        request.add_header("Content-Type", "application/x-www-form-urlencoded")
+        request.data = urlencode(
+            {
+                "grant_type": "client_credentials",
+                "client_id": self.api.key,
+                "client_secret": self.api.secret,
+            }
+        ).encode("utf-8")
+
+        return request
+
+    def set_token(self, response):
+        # Renew the token a minute before it actually expires
+        self._token = response["access_token"]
+        self._token_expiry = time.monotonic() + int(response.get("expires_in", 0)) - 60
+
+        return self._token
+
+    def get_token(self):
+        if self._token and time.monotonic() < self._token_expiry:
+            return self._token
+
+        return self.set_token(self.get_token_request().execute())
+
+    async def get_token_async(self):
+        if self._token and time.monotonic() < self._token_expiry:
+            return self._token
+
+        request = AsyncHTTPRequest.from_request(self.get_token_request())
+        return self.set_token(await request.execute())
+
+    def get_track_request(self, tracking_numbers):
+        message = {
+            "include_detailed_scans": True,
+            "trackingInfo": [
+                {
+                    "trackingNumberInfo": {
+                        "trackingNumber": tracking_number,
+                    }
+                }
+                for tracking_number in tracking_numbers
+            ],
+        }
+
+        return self.api.get_request(self.api.TRACK_BY_NUMBER, message, False)
+
+    def parse_response(self, tracking_numbers, response):
+        results = {tracking_number: [] for tracking_number in tracking_numbers}
 
         try:
-            all_results = response["output"]["completeTrackResults"][0]["trackResults"]
+            complete_results = response["output"]["completeTrackResults"]
+        except KeyError:
+            logging.error(f"Error getting events for {tracking_numbers}: {response}")
+            return results
+
+        for complete_result in complete_results:
+            tracking_number = complete_result.get("trackingNumber")
 
-            all_events = []
+            if tracking_number not in results:
+                if len(tracking_numbers) > 1:
+                    logging.warning(f"Got unexpected tracking number {tracking_number}")
+                    continue
 
-            for result in all_results:
+                tracking_number = tracking_numbers[0]
+
+            # Responses cover several shipments, so compare them one by one
+            if not self.response_cache.store(
+                tracking_number, json.dumps(complete_result, sort_keys=True).encode()
+            ):
+                logging.debug(f"No changes for {tracking_number}")
+                continue
+
+            # Don't let one malformed result lose the events of the others
+            try:
+                results[tracking_number] = list(
+                    self.parse_result(tracking_number, complete_result)
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                logging.error(f"Error parsing events for {tracking_number}: {e!r}")
+                self.forget_response(tracking_number, "fedex")
+
+        return results
+
+    def parse_result(self, tracking_number, complete_result):
+        all_events = []
+
+        try:
+            for result in complete_result["trackResults"]:
                 events = result["scanEvents"]
                 for event in events:
                     all_events.append(event)
 
             logging.debug(f"Got events for {tracking_number}: {len(all_events)}")
         except KeyError:
-            logging.error(f"Error getting events for {tracking_number}: {all_events}")
+            logging.error(f"Error getting events for {tracking_number}: {complete_result}")
             return
 
         events = sorted(all_events, key=lambda x: x["date"], reverse=True)
 
         for event in events:
-            event_time = parse(event["date"]).strftime("%Y-%m-%d %H:%M:%S")
+            event_time = self.normalize_time(event["date"])
             event_description = f"{event['scanLocation']['city'], event['scanLocation']['countryCode']} {event['eventDescription']}"
 
             yield Event(
                 shipment_id=0,
                 event_time=event_time,
                 event_description=event_description,
-                raw_event=json.dumps(event),
+                raw_event=event,
             )
 
     def supported_carriers(self):
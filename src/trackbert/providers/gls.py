@@ -1,27 +1,32 @@
 from ..classes.provider import BaseProvider
 from ..classes.database import Event
 
-import json
+import logging
 
 from glsapi.classes.api import GLSAPI
 
 
 class GLS(BaseProvider):
     def __init__(self, *args, **kwargs):
-        pass
+        self.api = GLSAPI()
 
     def get_status(self, tracking_number, carrier):
-        api = GLSAPI()
-        status = api.tracking(tracking_number)
+        request = self.api.get_request("rstt001", {"match": tracking_number})
+        status = self.response_cache.execute(tracking_number, request)
+
+        if status is None:
+            logging.debug(f"No changes for {tracking_number}")
+            return
+
         events = status["tuStatus"][0]["history"]
 
         for event in events:
-            event_time = f"{event['date']} {event['time']}"
+            event_time = self.normalize_time(f"{event['date']} {event['time']}")
             yield Event(
                 shipment_id=0,
                 event_time=event_time,
                 event_description=event["evtDscr"],
-                raw_event=json.dumps(event),
+                raw_event=event,
             )
 
     def supported_carriers(self):
@@ -3,16 +3,42 @@ from ..classes.database import Event
 
 from pykeydelivery import KeyDelivery as KeyDeliveryAPI
 
-import json
 import logging
 
 
 class KeyDelivery(BaseProvider):
+    fallback_carriers = [
+        ("*", 1),
+    ]
+
     def __init__(self, *args, **kwargs):
         self.api = KeyDeliveryAPI.from_config(str(kwargs.get("config")))
 
     def get_status(self, tracking_number, carrier):
-        all_events = self.api.realtime(carrier, tracking_number)
+        all_events = self.response_cache.execute(
+            (carrier, tracking_number), self.get_realtime_request(tracking_number, carrier)
+        )
+        yield from self.parse_response(tracking_number, all_events)
+
+    async def get_status_async(self, tracking_number, carrier):
+        all_events = await self.response_cache.execute_async(
+            (carrier, tracking_number), self.get_realtime_request(tracking_number, carrier)
+        )
+        return list(self.parse_response(tracking_number, all_events))
+
+    def get_realtime_request(self, tracking_number, carrier):
+        return self.api.get_request(
+            "tracking/realtime",
+            {
+                "carrier_id": carrier,
+                "tracking_number": tracking_number,
+            },
+        )
+
+    def parse_response(self, tracking_number, all_events):
+        if all_events is None:
+            logging.debug(f"No changes for {tracking_number}")
+            return
 
         try:
             logging.debug(
@@ -29,22 +55,20 @@ class KeyDelivery(BaseProvider):
         for event in events:
             yield Event(
                 shipment_id=0,
-                event_time=event["time"],
+                event_time=self.normalize_time(event["time"]),
                 event_description=event["context"],
-                raw_event=json.dumps(event),
+                raw_event=event,
             )
 
+    def fetch_carriers(self):
+        response = self.api.list_carriers()
+        return [(carrier["code"], 1, carrier["name"]) for carrier in response["data"]]
+
     def supported_carriers(self):
         try:
-            response = self.api.list_carriers()
-            carriers = [
-                (carrier["code"], 1, carrier["name"]) for carrier in response["data"]
-            ]
-            return carriers
+            return self.fetch_carriers()
         except Exception:
-            return [
-                ("*", 1),
-            ]
+            return self.fallback_carriers
 
 
 provider = KeyDelivery
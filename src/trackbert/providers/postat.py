@@ -4,31 +4,34 @@ from ..classes.database import Event
 import json
 import logging
 
-from dateutil.parser import parse
 from postat.classes.api import PostAPI
 
 
 class PostAT(BaseProvider):
     def __init__(self, *args, **kwargs):
-        pass
+        self.api = PostAPI()
 
     def get_status(self, tracking_number, carrier):
-        api = PostAPI()
-
         try:
-            status = api.get_shipment_status(tracking_number)
+            status = self.api.get_shipment_status(tracking_number)
+
+            # The API client only returns the decoded response
+            if not self.response_cache.store(
+                tracking_number, json.dumps(status, sort_keys=True).encode()
+            ):
+                logging.debug(f"No changes for {tracking_number}")
+                return
+
             shipment = status["data"]["einzelsendung"]
             events = shipment["sendungsEvents"]
 
             for event in events:
-                timestamp = event["timestamp"]
-                py_timestamp = parse(timestamp)
-                event_time = py_timestamp.strftime("%Y-%m-%d %H:%M:%S")
+                event_time = self.normalize_time(event["timestamp"])
                 yield Event(
                     shipment_id=0,
                     event_time=event_time,
                     event_description=event["text"],
-                    raw_event=json.dumps(event),
+                    raw_event=event,
                 )
 
         except Exception as e: